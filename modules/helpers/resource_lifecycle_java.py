@@ -1,175 +1,310 @@
 #!/usr/bin/env python3
-"""Detect JDBC lifecycle leaks (Statement/PreparedStatement/ResultSet)."""
+"""Detect JDBC lifecycle leaks (Statement/PreparedStatement/ResultSet).
+
+If Google's `re2` bindings (`pip install google-re2`) are importable, the declaration
+patterns run on RE2 so lazy `=.*?;` matches stay linear on malformed sources.
+"""
 from __future__ import annotations
 
+import hashlib
+import itertools
+import json
+import os
 import re
 import sys
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Iterator, TypeVar
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+def compile_linear(pattern: bytes, dotall: bool = False):
+    """Compile on RE2 when it is installed, otherwise on `re`.
+
+    RE2 reads bytes patterns as UTF-8 by default and then misses matches spanning
+    non-UTF-8 bytes, so it is switched to Latin-1 to see raw bytes the way `re` does.
+    """
+    if re2 is None:
+        return re.compile(pattern, re.DOTALL if dotall else 0)
+    options = re2.Options()
+    options.encoding = re2.Options.Encoding.LATIN1
+    options.dot_nl = dotall
+    return re2.compile(pattern, options)
 
 SKIP_DIRS = {".git", "node_modules", "dist", "build", "bin", "out", ".venv", "vendor"}
-STATEMENT_RE = re.compile(r"\b(?:PreparedStatement|CallableStatement|Statement)\s+([A-Za-z_][A-Za-z0-9_]*)\s*=.*?;", re.DOTALL)
-RESULTSET_RE = re.compile(r"\bResultSet\s+([A-Za-z_][A-Za-z0-9_]*)\s*=.*?;", re.DOTALL)
-TRY_RE = re.compile(r"\btry\s*\(")
-
-
-def strip_comments(text: str) -> str:
-    result: list[str] = []
-    i = 0
-    n = len(text)
-    in_line = False
-    in_block = False
-    in_string = False
-    in_text_block = False
-    string_quote = ""
-    escaped = False
-
-    def mask_char(ch: str) -> str:
-        return "\n" if ch == "\n" else " "
-
-    while i < n:
-        ch = text[i]
-        nxt = text[i + 1] if i + 1 < n else ""
-        nxt2 = text[i + 2] if i + 2 < n else ""
-
-        if in_line:
-            result.append(mask_char(ch))
-            if ch == "\n":
-                in_line = False
-            i += 1
-            continue
+# Declarations may backtrack across a whole method, so they get the linear-time engine when present.
+STATEMENT_RE = compile_linear(
+    rb"\b(?:PreparedStatement|CallableStatement|Statement)\s+([A-Za-z_][A-Za-z0-9_]*)\s*=.*?;", dotall=True
+)
+RESULTSET_RE = compile_linear(rb"\bResultSet\s+([A-Za-z_][A-Za-z0-9_]*)\s*=.*?;", dotall=True)
+# High-frequency token patterns stay on `re`: RE2's per-match overhead outweighs it on short matches.
+TRY_RE = re.compile(rb"\btry\s*\(")
+CLOSE_RE = re.compile(rb"\b([A-Za-z_][A-Za-z0-9_]*)\.close\s*\(")
+PAREN_RE = re.compile(rb"[()]")
+NEWLINE_RE = re.compile(rb"\n")
+# Text blocks, string/char literals (escapes may span lines) and comments; unterminated ones run to EOF.
+TOKEN_RE = re.compile(
+    rb'"""[\s\S]*?("""|\Z)'
+    rb'|"(?:[^"\\]+|\\[\s\S]?)*("|\Z)'
+    rb"|'(?:[^'\\]+|\\[\s\S]?)*('|\Z)"
+    rb"|//[^\n]*"
+    rb"|/\*[\s\S]*?(?:\*/|\Z)"
+)
+# Maps every byte except newline to a space, so masking is a single C-level translate().
+BLANK_TABLE = bytes(c if c == 0x0A else 0x20 for c in range(256))
+# Below this many files the process pool start-up costs more than it saves.
+PARALLEL_MIN_FILES = 32
+# Opt-in result cache: set this to a directory and unchanged files are replayed instead of re-analyzed.
+CACHE_DIR_ENV = "UBS_HELPER_CACHE_DIR"
+TOOL_NAME = "resource_lifecycle_java"
+# Any edit to this helper changes the salt and so invalidates previously cached results.
+CACHE_SALT = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
 
-        if in_block:
-            result.append(mask_char(ch))
-            if ch == "*" and nxt == "/":
-                result.append(" ")
-                in_block = False
-                i += 2
-            else:
-                i += 1
-            continue
+T = TypeVar("T")
 
-        if in_text_block:
-            if ch == '"' and nxt == '"' and nxt2 == '"':
-                result.extend('"""')
-                in_text_block = False
-                i += 3
-            else:
-                result.append(mask_char(ch))
-                i += 1
-            continue
 
-        if in_string:
-            if escaped:
-                result.append(mask_char(ch))
-                escaped = False
-            elif ch == "\\":
-                result.append(" ")
-                escaped = True
-            elif ch == string_quote:
-                result.append(ch)
-                in_string = False
-            else:
-                result.append(mask_char(ch))
-            i += 1
-            continue
+def _blank(segment: bytes) -> bytes:
+    return segment.translate(BLANK_TABLE)
 
-        if ch == '"' and nxt == '"' and nxt2 == '"':
-            in_text_block = True
-            result.extend('"""')
-            i += 3
-            continue
 
-        if ch in ('"', "'"):
-            in_string = True
-            string_quote = ch
-            result.append(ch)
-            i += 1
-            continue
+def _mask_token(match: re.Match[bytes]) -> bytes:
+    token = match.group(0)
+    if token.startswith(b"/"):
+        return _blank(token)
+    opener = b'"""' if match.group(1) is not None else token[:1]
+    closer = match.group(1) or match.group(2) or match.group(3) or b""
+    return opener + _blank(token[len(opener) : len(token) - len(closer)]) + closer
 
-        if ch == "/" and nxt == "/":
-            in_line = True
-            result.extend("  ")
-            i += 2
-            continue
 
-        if ch == "/" and nxt == "*":
-            in_block = True
-            result.extend("  ")
-            i += 2
-            continue
+def strip_comments(text: bytes) -> bytes:
+    """Blank out comments and string/text-block contents, keeping offsets and newlines."""
+    # Without quotes or slashes there is nothing to mask (common for generated code and fixtures).
+    if b'"' not in text and b"'" not in text and b"/" not in text:
+        return text
+    return TOKEN_RE.sub(_mask_token, text)
 
-        result.append(ch)
-        i += 1
 
-    return "".join(result)
+def _walk(root: Path, suffixes: tuple[str, ...], skip: set[str]) -> Iterable[Path]:
+    """Yield files under root ending in suffixes, pruning skipped directories."""
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    # Directory symlinks are not followed; symlinked source files are scanned like rglob did.
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(suffixes) and entry.is_file():
+                        yield Path(entry.path)
+        except OSError:
+            continue
 
 
 def iter_java_files(root: Path) -> Iterable[Path]:
     if root.is_file() and root.suffix.lower() == ".java":
         yield root
         return
-    for path in root.rglob("*.java"):
-        if any(part in SKIP_DIRS for part in path.parts):
-            continue
-        yield path
+    yield from _walk(root, (".java",), SKIP_DIRS)
+
 
+def close_positions(code_text: bytes) -> dict[bytes, int]:
+    """Map each receiver of a `.close(` call to the offset of its last such call."""
+    return {match.group(1): match.start() for match in CLOSE_RE.finditer(code_text)}
 
-def has_close(name: str, code_text: str, start_pos: int) -> bool:
-    pattern = re.compile(rf"\b{name}\.close\s*\(")
-    return bool(pattern.search(code_text, start_pos))
 
+def build_try_ranges(code_text: bytes) -> tuple[list[int], list[int]]:
+    """Return the header start and closing-paren offset of every `try (`, in source order."""
+    starts = [match.end() for match in TRY_RE.finditer(code_text)]
+    if not starts:
+        return starts, []
+    matching: dict[int, int] = {}
+    stack: list[int] = []
+    for match in PAREN_RE.finditer(code_text):
+        if match.group() == b"(":
+            stack.append(match.start())
+        elif stack:
+            matching[stack.pop()] = match.start()
+    closes = [matching.get(pos - 1, len(code_text)) for pos in starts]
+    return starts, closes
 
-def inside_try_with(text: str, start: int) -> bool:
-    match = None
-    for candidate in TRY_RE.finditer(text, 0, start):
-        match = candidate
-    if not match:
-        return False
-    depth = 1
-    for ch in text[match.end():start]:
-        if ch == '(':
-            depth += 1
-        elif ch == ')':
-            depth -= 1
-            if depth == 0:
-                return False
-    return depth > 0
 
+def inside_try_with(try_ranges: tuple[list[int], list[int]], start: int) -> bool:
+    starts, closes = try_ranges
+    idx = bisect_right(starts, start) - 1
+    return idx >= 0 and closes[idx] >= start
 
-def collect_issues(root: Path) -> list[tuple[str, str, int]]:
+
+def analyze_file(path: Path, project_root: Path) -> list[tuple[str, str, int]]:
     issues: list[tuple[str, str, int]] = []
-    project_root = root if root.is_dir() else root.parent
-    for path in iter_java_files(root):
-        try:
-            text = path.read_text(encoding="utf-8", errors="ignore")
-        except OSError:
-            continue
-        if not text.strip():
-            continue
-        code_text = strip_comments(text)
-        # lines = text.splitlines()
-        def handle_matches(regex: re.Pattern[str], kind: str) -> None:
-            for match in regex.finditer(code_text):
-                name = match.group(1)
-                if name == "_":
-                    continue
-                start = match.start()
-                line_no = text.count("\n", 0, start) + 1
-                # line_idx = line_no - 1
-                # line_text = lines[line_idx] if 0 <= line_idx < len(lines) else ""
-                # prefix = line_text.split(name, 1)[0]
-                if inside_try_with(code_text, start):
-                    continue
-                if has_close(name, code_text, start):
-                    continue
-                rel = str(path.relative_to(project_root)) if path.is_relative_to(project_root) else str(path)
-                issues.append((kind, rel, line_no))
-        handle_matches(STATEMENT_RE, "statement_handle")
-        handle_matches(RESULTSET_RE, "resultset_handle")
+    try:
+        text = path.read_bytes()
+    except OSError:
+        return issues
+    # Every finding needs a Statement/ResultSet declaration; skip other files before any scanning.
+    if b"Statement" not in text and b"ResultSet" not in text:
+        return issues
+    code_text = strip_comments(text)
+    statements = list(STATEMENT_RE.finditer(code_text))
+    resultsets = list(RESULTSET_RE.finditer(code_text))
+    # The close/try indexes are only needed once there is a declaration to check against them.
+    if not statements and not resultsets:
+        return issues
+    closed_at = close_positions(code_text)
+    try_ranges = build_try_ranges(code_text)
+    nl_positions = [match.start() for match in NEWLINE_RE.finditer(text)]
+    rel = str(path)
+    root_prefix = os.path.join(str(project_root), "")
+    if rel.startswith(root_prefix):
+        rel = rel[len(root_prefix) :]
+    # lines = text.splitlines()
+    def handle_matches(matches: list[re.Match[bytes]], kind: str) -> None:
+        for match in matches:
+            name = match.group(1)
+            if name == b"_":
+                continue
+            start = match.start()
+            # line_idx = line_no - 1
+            # line_text = lines[line_idx] if 0 <= line_idx < len(lines) else ""
+            # prefix = line_text.split(name, 1)[0]
+            if inside_try_with(try_ranges, start):
+                continue
+            if closed_at.get(name, -1) >= start:
+                continue
+            line_no = bisect_left(nl_positions, start) + 1
+            issues.append((kind, rel, line_no))
+    handle_matches(statements, "statement_handle")
+    handle_matches(resultsets, "resultset_handle")
     return issues
 
 
+def map_files(func: Callable[..., T], files: list[Path], *args: object) -> Iterator[T]:
+    """Apply func to each file in order, fanning out to worker processes on larger trees."""
+    if len(files) >= PARALLEL_MIN_FILES:
+        try:
+            executor = ProcessPoolExecutor()
+        except (NotImplementedError, OSError):
+            pass
+        else:
+            chunksize = max(1, len(files) // ((os.cpu_count() or 1) * 4))
+            with executor:
+                yield from executor.map(func, files, *(itertools.repeat(arg) for arg in args), chunksize=chunksize)
+            return
+    for path in files:
+        yield func(path, *args)
+
+
+def _cache_path(root: Path) -> Path | None:
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    # One file per scanned root, so projects sharing a cache directory do not evict each other.
+    root_hash = hashlib.blake2b(os.fsencode(root.resolve()), digest_size=8).hexdigest()
+    return Path(cache_dir) / f"{TOOL_NAME}-{root_hash}.json"
+
+
+def load_cache(root: Path) -> dict[str, dict] | None:
+    """Return root's cached "entries" (content key -> results) and "stats" (stat key -> content key).
+
+    Returns None when caching is disabled.
+    """
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return None
+    empty: dict[str, dict] = {"entries": {}, "stats": {}}
+    try:
+        data = json.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(data, dict) or data.get("salt") != CACHE_SALT:
+        return empty
+    entries, stats = data.get("entries"), data.get("stats")
+    if not isinstance(entries, dict) or not isinstance(stats, dict):
+        return empty
+    return {"entries": entries, "stats": stats}
+
+
+def save_cache(root: Path, entries: dict[str, list], stats: dict[str, str]) -> None:
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps({"salt": CACHE_SALT, "entries": entries, "stats": stats}), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _digest(*parts: bytes) -> str:
+    return hashlib.blake2b(b"\0".join(parts), digest_size=16).hexdigest()
+
+
+def stat_key(path: Path, context: bytes) -> str | None:
+    """Key a file on its stat; an unchanged stat lets a run trust the cached content key without reading it."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d:%d:%d" % (st.st_size, st.st_mtime_ns, st.st_ctime_ns))
+
+
+def cache_key(path: Path, context: bytes) -> str | None:
+    """Key a file on its size and content, which survive fresh checkouts, chmod and touch."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d" % len(data), hashlib.blake2b(data).digest())
+
+
+def map_files_cached(
+    func: Callable[..., list], files: list[Path], *args: object, cache_root: Path
+) -> Iterator[list]:
+    """Like map_files, but replay results for files under cache_root whose contents are unchanged since the last run."""
+    cache = load_cache(cache_root)
+    if cache is None:
+        yield from map_files(func, files, *args)
+        return
+    cached_entries, cached_stats = cache["entries"], cache["stats"]
+    context = repr(args).encode()
+    stat_keys = [stat_key(path, context) for path in files]
+    keys: list[str | None] = []
+    for path, skey in zip(files, stat_keys):
+        key = cached_stats.get(skey) if skey is not None else None
+        if key not in cached_entries:
+            # New stat (fresh checkout, touch, chmod): hash the contents before counting it as a miss.
+            key = cache_key(path, context)
+        keys.append(key)
+    misses = [path for path, key in zip(files, keys) if key not in cached_entries]
+    fresh = map_files(func, misses, *args)
+    entries: dict[str, list] = {}
+    stats: dict[str, str] = {}
+    for skey, key in zip(stat_keys, keys):
+        result = cached_entries[key] if key in cached_entries else next(fresh)
+        if key is not None:
+            entries[key] = result
+            if skey is not None:
+                stats[skey] = key
+        yield result
+    # Only this run's files are kept, so entries for deleted or edited files do not pile up.
+    save_cache(cache_root, entries, stats)
+
+
+def iter_issues(root: Path) -> Iterator[list[tuple[str, str, int]]]:
+    """Yield each file's findings, in path order, as soon as it is analyzed."""
+    project_root = root if root.is_dir() else root.parent
+    files = sorted(iter_java_files(root), key=str)
+    yield from map_files_cached(analyze_file, files, project_root, cache_root=root)
+
+
 def main() -> int:
     if len(sys.argv) != 2:
         print("usage: resource_lifecycle_java.py <project_dir>", file=sys.stderr)
@@ -177,9 +312,10 @@ def main() -> int:
     root = Path(sys.argv[1]).resolve()
     if not root.exists():
         return 0
-    issues = collect_issues(root)
-    for kind, rel, line in issues:
-        print(f"{rel}:{line}\t{kind}")
+    write = sys.stdout.write
+    for file_issues in iter_issues(root):
+        if file_issues:
+            write("".join(f"{rel}:{line}\t{kind}\n" for kind, rel, line in file_issues))
     return 0
 
 
@@ -3,9 +3,15 @@
 from __future__ import annotations
 
 import ast
+import hashlib
+import itertools
+import json
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
 
 TARGET_SIGS: dict[tuple[Optional[str], str], str] = {
     (None, "open"): "file_handle",
@@ -23,12 +29,21 @@ TARGET_SIGS: dict[tuple[Optional[str], str], str] = {
     ("asyncio", "create_task"): "asyncio_task",
 }
 
+# A file can only acquire a tracked resource if it names one of these callables.
+TARGET_TOKENS = tuple(sorted({obj.encode() for _, obj in TARGET_SIGS}))
+# Whole-word check, so `opened` or `reopen` alone does not send a file through ast.parse.
+TARGET_NAME_RE = re.compile(rb"\b(?:" + b"|".join(TARGET_TOKENS) + rb")\b")
+
 RELEASE_METHODS = {
     "file_handle": {"close"},
     "socket_handle": {"close", "shutdown"},
     "popen_handle": {"wait", "communicate", "terminate", "kill"},
     "asyncio_task": {"cancel"},
 }
+# Release method -> kind it releases; built in reverse so the first kind listed wins (e.g. close).
+RELEASE_KIND_BY_METHOD = {
+    method: kind for kind, methods in reversed(RELEASE_METHODS.items()) for method in methods
+}
 
 TASK_RELEASE_SIGS = {
     ("asyncio", "gather"),
@@ -60,6 +75,21 @@ IGNORED_PARTS = {
     "target",
 }
 
+# Below this many files the process pool start-up costs more than it saves.
+PARALLEL_MIN_FILES = 32
+# Opt-in result cache: set this to a directory and unchanged files are replayed instead of re-analyzed.
+CACHE_DIR_ENV = "UBS_HELPER_CACHE_DIR"
+TOOL_NAME = "resource_lifecycle_py"
+# Any edit to this helper changes the salt and so invalidates previously cached results.
+CACHE_SALT = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
+
+T = TypeVar("T")
+
+# Marks where Analyzer.walk leaves a function body and must pop its scope.
+_POP_SCOPE = object()
+# Distinguishes "not cached yet" from a cached None in the Analyzer memo tables.
+_MISSING = object()
+
 
 class ResourceRecord:
     __slots__ = ("name", "kind", "lineno", "released")
@@ -72,18 +102,38 @@ class ResourceRecord:
 
 
 class Scope:
+    __slots__ = ("aliases", "by_name")
+
     def __init__(self) -> None:
         self.aliases: dict[str, tuple[Optional[str], Optional[str]]] = {}
         self.by_name: dict[str, list[ResourceRecord]] = {}
 
 
-class Analyzer(ast.NodeVisitor):
+class Analyzer:
     def __init__(self, tree: ast.AST) -> None:
         self.tree = tree
         self.records: list[ResourceRecord] = []
         self.safe_calls: set[int] = set()
         self.assigned_calls: set[int] = set()
         self.scope_stack: list[Scope] = [Scope()]
+        self._sig_cache: dict[int, Optional[tuple[Optional[str], str]]] = {}
+        self._dotted_cache: dict[int, Optional[str]] = {}
+        self._pending: list[object] = []
+        self._dispatch: dict[type, Callable[[Any], None]] = {
+            ast.FunctionDef: self._visit_func,
+            ast.AsyncFunctionDef: self._visit_func,
+            ast.Import: self._visit_import,
+            ast.ImportFrom: self._visit_importfrom,
+            ast.Return: self._visit_return,
+            ast.Yield: self._visit_return,
+            ast.YieldFrom: self._visit_return,
+            ast.With: self._visit_with,
+            ast.AsyncWith: self._visit_with,
+            ast.Assign: self._visit_assign,
+            ast.AnnAssign: self._visit_annassign,
+            ast.Call: self._visit_call,
+            ast.Await: self._visit_await,
+        }
 
     @property
     def current_scope(self) -> Scope:
@@ -95,24 +145,37 @@ class Analyzer(ast.NodeVisitor):
                 return scope.aliases[name]
         return (None, None)
 
-    # Scopes -------------------------------------------------------------
-    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
-        self.scope_stack.append(Scope())
-        self.generic_visit(node)
-        self.scope_stack.pop()
+    # Traversal ----------------------------------------------------------
+    def walk(self, tree: ast.AST) -> None:
+        """Pre-order walk matching ast.NodeVisitor order, dispatching on exact node type."""
+        pending = self._pending
+        pending.append(tree)
+        dispatch = self._dispatch
+        while pending:
+            node = pending.pop()
+            if node is _POP_SCOPE:
+                self.scope_stack.pop()
+                continue
+            handler = dispatch.get(type(node))
+            if handler is not None:
+                handler(node)
+            children = list(ast.iter_child_nodes(node))  # type: ignore[arg-type]
+            children.reverse()
+            pending.extend(children)
 
-    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+    # Scopes -------------------------------------------------------------
+    def _visit_func(self, node: ast.FunctionDef | ast.AsyncFunctionDef) -> None:
+        # The sentinel sits beneath the children, so the scope pops once they are done.
         self.scope_stack.append(Scope())
-        self.generic_visit(node)
-        self.scope_stack.pop()
+        self._pending.append(_POP_SCOPE)
 
     # Imports -------------------------------------------------------------
-    def visit_Import(self, node: ast.Import) -> None:
+    def _visit_import(self, node: ast.Import) -> None:
         for alias in node.names:
             asname = alias.asname or alias.name
             self.current_scope.aliases[asname] = (alias.name, None)
 
-    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+    def _visit_importfrom(self, node: ast.ImportFrom) -> None:
         module = node.module or ""
         for alias in node.names:
             if alias.name == "*":
@@ -121,20 +184,9 @@ class Analyzer(ast.NodeVisitor):
             self.current_scope.aliases[asname] = (module, alias.name)
 
     # Return/Yield -------------------------------------------------------
-    def visit_Return(self, node: ast.Return) -> None:
-        if node.value:
-            self._handle_return_yield(node.value)
-        self.generic_visit(node)
-
-    def visit_Yield(self, node: ast.Yield) -> None:
+    def _visit_return(self, node: ast.Return | ast.Yield | ast.YieldFrom) -> None:
         if node.value:
             self._handle_return_yield(node.value)
-        self.generic_visit(node)
-
-    def visit_YieldFrom(self, node: ast.YieldFrom) -> None:
-        if node.value:
-            self._handle_return_yield(node.value)
-        self.generic_visit(node)
 
     def _handle_return_yield(self, value: ast.AST) -> None:
         # Returning/yielding a resource is an *escape*, not a cleanup. UBS should still
@@ -146,13 +198,8 @@ class Analyzer(ast.NodeVisitor):
         _ = value
 
     # With/async with -----------------------------------------------------
-    def visit_With(self, node: ast.With) -> None:
+    def _visit_with(self, node: ast.With | ast.AsyncWith) -> None:
         self._mark_context_safe(node.items)
-        self.generic_visit(node)
-
-    def visit_AsyncWith(self, node: ast.AsyncWith) -> None:
-        self._mark_context_safe(node.items)
-        self.generic_visit(node)
 
     def _mark_context_safe(self, items: list[ast.withitem]) -> None:
         for item in items:
@@ -172,16 +219,14 @@ class Analyzer(ast.NodeVisitor):
             self._mark_safe_calls(expr.value)
 
     # Assignments --------------------------------------------------------
-    def visit_Assign(self, node: ast.Assign) -> None:
+    def _visit_assign(self, node: ast.Assign) -> None:
         self._handle_assignment(node.targets, node.value)
-        self.generic_visit(node)
 
-    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+    def _visit_annassign(self, node: ast.AnnAssign) -> None:
         if node.value is not None:
             self._handle_assignment([node.target], node.value)
-        self.generic_visit(node)
 
-    def _handle_assignment(self, targets: list[ast.expr], value: ast.AST) -> None:
+    def _handle_assignment(self, targets: list[ast.expr], value: ast.expr) -> None:
         sig = self._call_signature_from_expr(value)
         if not sig:
             return
@@ -210,15 +255,14 @@ class Analyzer(ast.NodeVisitor):
         return []
 
     # Calls/releases -----------------------------------------------------
-    def visit_Call(self, node: ast.Call) -> None:
+    def _visit_call(self, node: ast.Call) -> None:
         if id(node) not in self.assigned_calls:
             sig = self._call_signature(node)
             if sig and sig in TARGET_SIGS and id(node) not in self.safe_calls:
                 self._add_record(None, TARGET_SIGS[sig], node.lineno)
         self._handle_release(node)
-        self.generic_visit(node)
 
-    def visit_Await(self, node: ast.Await) -> None:
+    def _visit_await(self, node: ast.Await) -> None:
         if isinstance(node.value, ast.Name):
             self._mark_released(node.value.id, "asyncio_task", check_all_scopes=True)
         elif isinstance(node.value, ast.Call):
@@ -227,7 +271,6 @@ class Analyzer(ast.NodeVisitor):
                 # `await asyncio.create_task(...)` is effectively a task "release"
                 # since the awaited expression is observed to completion.
                 self.safe_calls.add(id(node.value))
-        self.generic_visit(node)
 
     def _handle_release(self, node: ast.Call) -> None:
         func = node.func
@@ -243,12 +286,9 @@ class Analyzer(ast.NodeVisitor):
                     base_kind = TARGET_SIGS.get(base_sig)
                     if base_kind and func.attr in RELEASE_METHODS.get(base_kind, set()):
                         self.safe_calls.add(id(func.value))
-            name = self._dotted_name(func.value)
-            method = func.attr
-            for kind, methods in RELEASE_METHODS.items():
-                if method in methods:
-                    self._mark_released(name, kind, check_all_scopes=True)
-                    break
+            kind = RELEASE_KIND_BY_METHOD.get(func.attr)
+            if kind:
+                self._mark_released(self._dotted_name(func.value), kind, check_all_scopes=True)
 
         sig = self._call_signature(node)
         if sig in TASK_RELEASE_SIGS:
@@ -306,6 +346,17 @@ class Analyzer(ast.NodeVisitor):
         return None
 
     def _call_signature(self, call: ast.Call) -> Optional[tuple[Optional[str], str]]:
+        # Calls are resolved several times per visit (with/assign/release checks, chained
+        # bases); alias state cannot change within one expression, so caching is safe.
+        key = id(call)
+        cached = self._sig_cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached  # type: ignore[return-value]
+        sig = self._resolve_call_signature(call)
+        self._sig_cache[key] = sig
+        return sig
+
+    def _resolve_call_signature(self, call: ast.Call) -> Optional[tuple[Optional[str], str]]:
         func = call.func
         if isinstance(func, ast.Name):
             module, obj = self._lookup_alias(func.id)
@@ -335,13 +386,18 @@ class Analyzer(ast.NodeVisitor):
     def _dotted_name(self, expr: ast.expr) -> Optional[str]:
         if isinstance(expr, ast.Name):
             return expr.id
-        if isinstance(expr, ast.Attribute):
-            base = self._dotted_name(expr.value)
-            if base:
-                return f"{base}.{expr.attr}"
-        return None
-
-    def report(self, path: Path) -> list[str]:
+        if not isinstance(expr, ast.Attribute):
+            return None
+        key = id(expr)
+        cached = self._dotted_cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached  # type: ignore[return-value]
+        base = self._dotted_name(expr.value)
+        dotted = f"{base}.{expr.attr}" if base else None
+        self._dotted_cache[key] = dotted
+        return dotted
+
+    def report(self, path: str) -> list[str]:
         issues: list[str] = []
         for rec in sorted(self.records, key=lambda r: (r.lineno, r.kind, r.name or "")):
             if rec.released:
@@ -353,48 +409,183 @@ class Analyzer(ast.NodeVisitor):
         return issues
 
 
+def _walk(root: Path, suffixes: tuple[str, ...], skip: set[str]) -> Iterable[Path]:
+    """Yield files under root ending in suffixes, pruning skipped directories."""
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    # Directory symlinks are not followed; symlinked source files are scanned like rglob did.
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(suffixes) and entry.is_file():
+                        yield Path(entry.path)
+        except OSError:
+            continue
+
+
 def collect_files(root: Path) -> list[Path]:
-    files: list[Path] = []
     if root.is_file() and root.suffix == ".py":
         return [root]
-    for path in root.rglob("*.py"):
-        if any(part in IGNORED_PARTS for part in path.parts):
-            continue
-        files.append(path)
-    return files
+    return list(_walk(root, (".py",), IGNORED_PARTS))
 
 
-def analyze(path: Path, root: Path) -> list[str]:
+def analyze(path: Path, root: Path) -> Optional[list[str]]:
+    """Return the findings for path, or None when it could not be read or parsed."""
     try:
-        text = path.read_text(encoding="utf-8")
+        raw = path.read_bytes()
     except OSError as e:
         print(f"WARN: Could not read {path}: {e}", file=sys.stderr)
+        return None
+    if not any(token in raw for token in TARGET_TOKENS) or not TARGET_NAME_RE.search(raw):
         return []
     try:
-        tree = ast.parse(text)
-    except SyntaxError as e:
+        # Parsing bytes honours PEP 263 coding cookies; undecodable sources raise SyntaxError.
+        tree = ast.parse(raw)
+    except (SyntaxError, ValueError) as e:
         print(f"WARN: Syntax error in {path}: {e}", file=sys.stderr)
-        return []
+        return None
     analyzer = Analyzer(tree)
-    analyzer.visit(tree)
-    display: Path
-    try:
-        display = path.relative_to(root)
-    except ValueError:
-        display = path
+    analyzer.walk(tree)
+    # Plain string prefix strip; paths from _walk are already normalized the way relative_to() compares.
+    display = str(path)
+    root_prefix = os.path.join(str(root), "")
+    if display.startswith(root_prefix):
+        display = display[len(root_prefix) :]
+    elif display == str(root):
+        display = "."
     return analyzer.report(display)
 
 
+def map_files(func: Callable[..., T], files: list[Path], *args: object) -> Iterator[T]:
+    """Apply func to each file in order, fanning out to worker processes on larger trees."""
+    if len(files) >= PARALLEL_MIN_FILES:
+        try:
+            executor = ProcessPoolExecutor()
+        except (NotImplementedError, OSError):
+            pass
+        else:
+            chunksize = max(1, len(files) // ((os.cpu_count() or 1) * 4))
+            with executor:
+                yield from executor.map(func, files, *(itertools.repeat(arg) for arg in args), chunksize=chunksize)
+            return
+    for path in files:
+        yield func(path, *args)
+
+
+def _cache_path(root: Path) -> Optional[Path]:
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    # One file per scanned root, so projects sharing a cache directory do not evict each other.
+    root_hash = hashlib.blake2b(os.fsencode(root.resolve()), digest_size=8).hexdigest()
+    return Path(cache_dir) / f"{TOOL_NAME}-{root_hash}.json"
+
+
+def load_cache(root: Path) -> Optional[dict[str, dict]]:
+    """Return root's cached "entries" (content key -> results) and "stats" (stat key -> content key).
+
+    Returns None when caching is disabled.
+    """
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return None
+    empty: dict[str, dict] = {"entries": {}, "stats": {}}
+    try:
+        data = json.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(data, dict) or data.get("salt") != CACHE_SALT:
+        return empty
+    entries, stats = data.get("entries"), data.get("stats")
+    if not isinstance(entries, dict) or not isinstance(stats, dict):
+        return empty
+    return {"entries": entries, "stats": stats}
+
+
+def save_cache(root: Path, entries: dict[str, list], stats: dict[str, str]) -> None:
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps({"salt": CACHE_SALT, "entries": entries, "stats": stats}), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _digest(*parts: bytes) -> str:
+    return hashlib.blake2b(b"\0".join(parts), digest_size=16).hexdigest()
+
+
+def stat_key(path: Path, context: bytes) -> Optional[str]:
+    """Key a file on its stat; an unchanged stat lets a run trust the cached content key without reading it."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d:%d:%d" % (st.st_size, st.st_mtime_ns, st.st_ctime_ns))
+
+
+def cache_key(path: Path, context: bytes) -> Optional[str]:
+    """Key a file on its size and content, which survive fresh checkouts, chmod and touch."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d" % len(data), hashlib.blake2b(data).digest())
+
+
+def map_files_cached(
+    func: Callable[..., Optional[list]], files: list[Path], *args: object, cache_root: Path
+) -> Iterator[Optional[list]]:
+    """Like map_files, but replay results for files under cache_root whose contents are unchanged since the last run."""
+    cache = load_cache(cache_root)
+    if cache is None:
+        yield from map_files(func, files, *args)
+        return
+    cached_entries, cached_stats = cache["entries"], cache["stats"]
+    context = repr(args).encode()
+    stat_keys = [stat_key(path, context) for path in files]
+    keys: list[Optional[str]] = []
+    for path, skey in zip(files, stat_keys):
+        key = cached_stats.get(skey) if skey is not None else None
+        if key not in cached_entries:
+            # New stat (fresh checkout, touch, chmod): hash the contents before counting it as a miss.
+            key = cache_key(path, context)
+        keys.append(key)
+    misses = [path for path, key in zip(files, keys) if key not in cached_entries]
+    fresh = map_files(func, misses, *args)
+    entries: dict[str, list] = {}
+    stats: dict[str, str] = {}
+    for skey, key in zip(stat_keys, keys):
+        result = cached_entries[key] if key in cached_entries else next(fresh)
+        # None marks a file that could not be analyzed; leave it uncached so its warning repeats.
+        if key is not None and result is not None:
+            entries[key] = result
+            if skey is not None:
+                stats[skey] = key
+        yield result
+    # Only this run's files are kept, so entries for deleted or edited files do not pile up.
+    save_cache(cache_root, entries, stats)
+
+
 def main() -> None:
     if len(sys.argv) != 2:
         print("usage: resource_lifecycle_py.py <project_dir>", file=sys.stderr)
         sys.exit(2)
     root = Path(sys.argv[1])
-    issues: list[str] = []
-    for path in sorted(collect_files(root), key=lambda p: str(p)):
-        issues.extend(analyze(path, root))
-    if issues:
-        print("\n".join(issues))
+    files = sorted(collect_files(root), key=lambda p: str(p))
+    # Stream each file's findings as soon as it is analyzed instead of holding them all.
+    write = sys.stdout.write
+    for file_issues in map_files_cached(analyze, files, root, cache_root=root):
+        if file_issues:
+            write("\n".join(file_issues) + "\n")
 
 
 if __name__ == "__main__":
@@ -1,20 +1,99 @@
 #!/usr/bin/env python3
-"""Detect Kotlin null guards that do not exit before using the guarded value with `!!`."""
+"""Detect Kotlin null guards that do not exit before using the guarded value with `!!`.
+
+If Google's `re2` bindings (`pip install google-re2`) are importable, the guard and
+declaration patterns run on RE2 so their open-ended scans stay linear on long lines.
+"""
 from __future__ import annotations
 
+import hashlib
+import itertools
+import json
+import os
 import re
 import sys
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+def compile_linear(pattern: bytes, dotall: bool = False):
+    """Compile on RE2 when it is installed, otherwise on `re`.
+
+    RE2 reads bytes patterns as UTF-8 by default and then misses matches spanning
+    non-UTF-8 bytes, so it is switched to Latin-1 to see raw bytes the way `re` does.
+    """
+    if re2 is None:
+        return re.compile(pattern, re.DOTALL if dotall else 0)
+    options = re2.Options()
+    options.encoding = re2.Options.Encoding.LATIN1
+    options.dot_nl = dotall
+    return re2.compile(pattern, options)
 
 SKIP_DIRS = {".git", "build", "out", "dist", "target", ".gradle", ".idea", "node_modules"}
-NEGATIVE_GUARD_PATTERN = re.compile(r"if\s*\(\s*([A-Za-z_][\w]*)\s*(?:==|===)\s*null[^)]*\)", re.MULTILINE)
-POSITIVE_GUARD_PATTERN = re.compile(r"if\s*\(\s*([A-Za-z_][\w]*)\s*!=\s*null[^)]*\)", re.MULTILINE)
-SAFE_CALL_GUARD_PATTERN = re.compile(r"if\s*\(\s*([A-Za-z_][\w]*)\s*\?\.[^)]*\)", re.MULTILINE)
-DOUBLE_BANG_PATTERN = "{name}\\s*!!"
-ASSIGN_PATTERN = re.compile(r"{name}\s*=")
-EXIT_PATTERN = re.compile(r"\b(return|throw|continue|break)\b")
-SMART_CAST_PATTERN = re.compile(r"\b(?:val|var)\s+([A-Za-z_][\w]*)\s*=\s*[^;\n]+as\?\s+[A-Za-z0-9_.]+")
-ELVIS_ASSIGN_PATTERN = re.compile(r"\b(?:val|var)\s+([A-Za-z_][\w]*)\s*=\s*[^;\n]+?\?:")
+# `== null`, `!= null` and `?.` guards in one pass; the group that matched (2, 3 or 4) picks the rule.
+# Groups are numbered because RE2 cannot look up named groups on bytes patterns.
+GUARD_PATTERN = compile_linear(
+    rb"if\s*\(\s*([A-Za-z_][\w]*)\s*(?:(==|===)\s*null|(!=)\s*null|(\?\.))[^)]*\)"
+)
+# Guard kind -> (message, skip when the guard body exits), listed in reporting order.
+GUARD_RULES = {
+    # ?. guard: if (x?.prop) { ... }
+    # Whether or not the block exits, x might be null (if prop was false/null). So x!! is unsafe.
+    "safe": ("{name}!! used after ?. guard without exit", False),
+    # == null guard: if (x == null) { ... }
+    # If block exits, x is not null. Safe. If block continues, x is null. Unsafe.
+    "neg": ("{name}!! after non-exiting null guard", True),
+    # != null guard: if (x != null) { ... }
+    # Whether or not the block exits, x may be null afterwards. Unsafe.
+    "pos": ("{name}!! used after '!= null' guard without exit", False),
+}
+SMART_CAST_PATTERN = compile_linear(rb"\b(?:val|var)\s+([A-Za-z_][\w]*)\s*=\s*[^;\n]+as\?\s+[A-Za-z0-9_.]+")
+ELVIS_ASSIGN_PATTERN = compile_linear(rb"\b(?:val|var)\s+([A-Za-z_][\w]*)\s*=\s*[^;\n]+?\?:")
+# High-frequency token patterns stay on `re`: RE2's per-match overhead outweighs it on short matches.
+DOUBLE_BANG_ANY = re.compile(rb"\b([A-Za-z_]\w*)\s*!!")
+ASSIGN_ANY = re.compile(rb"\b([A-Za-z_]\w*)\s*=")
+NEWLINE_PATTERN = re.compile(rb"\n")
+EXIT_PATTERN = re.compile(rb"\b(return|throw|continue|break)\b")
+EXIT_LITERALS = (b"return", b"throw", b"continue", b"break")
+# On longer blocks a few memmem scans rule out exit-free bodies faster than the \b regex can.
+EXIT_PREFILTER_MIN_BYTES = 256
+WHITESPACE_PATTERN = re.compile(rb"\s*")
+BRACE_PATTERN = re.compile(rb"[{}]")
+OPEN_BRACE = ord("{")
+# Below this many files the process pool start-up costs more than it saves.
+PARALLEL_MIN_FILES = 32
+# Opt-in result cache: set this to a directory and unchanged files are replayed instead of re-analyzed.
+CACHE_DIR_ENV = "UBS_HELPER_CACHE_DIR"
+TOOL_NAME = "type_narrowing_kotlin"
+# Any edit to this helper changes the salt and so invalidates previously cached results.
+CACHE_SALT = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
+
+T = TypeVar("T")
+
+
+def _walk(root: Path, suffixes: tuple[str, ...], skip: set[str]) -> Iterable[Path]:
+    """Yield files under root ending in suffixes, pruning skipped directories."""
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    # Directory symlinks are not followed; symlinked source files are scanned like rglob did.
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(suffixes) and entry.is_file():
+                        yield Path(entry.path)
+        except OSError:
+            continue
 
 
 def iter_kotlin_files(root: Path):
@@ -23,138 +102,141 @@ def iter_kotlin_files(root: Path):
             yield root
         return
 
-    # Glob both .kt and .kts files (Kotlin script files)
-    for ext in ("*.kt", "*.kts"):
-        for path in root.rglob(ext):
-            if any(part in SKIP_DIRS for part in path.parts):
-                continue
-            if path.is_file():
-                yield path
+    # Both .kt and .kts files (Kotlin script files)
+    yield from _walk(root, (".kt", ".kts"), SKIP_DIRS)
 
 
-def find_block_end(text: str, brace_start: int) -> int:
+def find_block_end(text: bytes, brace_start: int) -> int:
     depth = 0
-    for idx in range(brace_start, len(text)):
-        ch = text[idx]
-        if ch == "{":
+    # Only visit the braces themselves; the scan between them happens in C.
+    for match in BRACE_PATTERN.finditer(text, brace_start):
+        idx = match.start()
+        if text[idx] == OPEN_BRACE:
             depth += 1
-        elif ch == "}":
+        else:
             depth -= 1
             if depth == 0:
                 return idx
     return len(text) - 1
 
 
-def first_non_space(text: str, idx: int) -> int:
-    while idx < len(text) and text[idx].isspace():
-        idx += 1
-    return idx
+def first_non_space(text: bytes, idx: int) -> int:
+    match = WHITESPACE_PATTERN.match(text, idx)
+    return match.end() if match else idx
 
 
-def extract_guard_region(text: str, match_end: int) -> tuple[str, int]:
+def extract_guard_region(text: bytes, match_end: int) -> tuple[bytes, int]:
     """Return guard body text and index immediately following the guard."""
     idx = first_non_space(text, match_end)
-    if idx < len(text) and text[idx] == "{":
+    if idx < len(text) and text[idx] == OPEN_BRACE:
         block_end = find_block_end(text, idx)
         return text[idx : block_end + 1], block_end + 1
 
-    newline = text.find("\n", idx)
+    newline = text.find(b"\n", idx)
     if newline == -1:
         newline = len(text)
     return text[idx:newline], newline
 
 
-def contains_exit(block_text: str) -> bool:
+def contains_exit(block_text: bytes) -> bool:
+    if len(block_text) >= EXIT_PREFILTER_MIN_BYTES and not any(word in block_text for word in EXIT_LITERALS):
+        return False
     return bool(EXIT_PATTERN.search(block_text))
 
 
-def line_col(text: str, pos: int) -> tuple[int, int]:
-    line = text.count("\n", 0, pos) + 1
-    last_newline = text.rfind("\n", 0, pos)
-    if last_newline == -1:
-        col = pos + 1
-    else:
-        col = pos - last_newline
+def newline_offsets(text: bytes) -> list[int]:
+    return [match.start() for match in NEWLINE_PATTERN.finditer(text)]
+
+
+def line_col(text: bytes, nl_positions: list[int], pos: int) -> tuple[int, int]:
+    """Return the 1-based line and character (not byte) column of a byte offset."""
+    line = bisect_left(nl_positions, pos) + 1
+    line_start = nl_positions[line - 2] + 1 if line > 1 else 0
+    col = len(text[line_start:pos].decode("utf-8", errors="ignore")) + 1
     return line, col
 
 
-def collect_guard_issues(text: str, pattern: re.Pattern[str], message: str, skip_on_exit: bool = True):
-    issues = []
+def positions_by_name(pattern: re.Pattern[bytes], text: bytes) -> dict[bytes, list[int]]:
+    positions: dict[bytes, list[int]] = {}
     for match in pattern.finditer(text):
+        positions.setdefault(match.group(1), []).append(match.start())
+    return positions
+
+
+def first_at_or_after(positions: list[int] | None, pos: int) -> int | None:
+    if not positions:
+        return None
+    idx = bisect_left(positions, pos)
+    return positions[idx] if idx < len(positions) else None
+
+
+def collect_guard_issues(
+    text: bytes,
+    nl_positions: list[int],
+    double_bangs: dict[bytes, list[int]],
+    assigns: dict[bytes, list[int]],
+):
+    issues_by_kind: dict[str, list[tuple[int, int, str]]] = {kind: [] for kind in GUARD_RULES}
+    for match in GUARD_PATTERN.finditer(text):
         var_name = match.group(1)
+        kind = "neg" if match.group(2) else "pos" if match.group(3) else "safe"
+        message, skip_on_exit = GUARD_RULES[kind]
         block_text, guard_end = extract_guard_region(text, match.end())
         if skip_on_exit and contains_exit(block_text):
             continue
-        assign_regex = re.compile(ASSIGN_PATTERN.pattern.format(name=re.escape(var_name)))
-        double_regex = re.compile(DOUBLE_BANG_PATTERN.format(name=re.escape(var_name)))
-        search_pos = guard_end
-        while True:
-            double_match = double_regex.search(text, search_pos)
-            if not double_match:
-                break
-            assign_match = assign_regex.search(text, search_pos, double_match.start())
-            if assign_match:
-                break
-            absolute_pos = double_match.start()
-            line, col = line_col(text, absolute_pos)
-            issues.append((line, col, message.format(name=var_name)))
-            break
-    return issues
+        double_pos = first_at_or_after(double_bangs.get(var_name), guard_end)
+        if double_pos is None:
+            continue
+        assign_pos = first_at_or_after(assigns.get(var_name), guard_end)
+        if assign_pos is not None and assign_pos < double_pos:
+            continue
+        line, col = line_col(text, nl_positions, double_pos)
+        issues_by_kind[kind].append((line, col, message.format(name=var_name.decode("ascii"))))
+    return [issue for kind_issues in issues_by_kind.values() for issue in kind_issues]
 
 
-def collect_double_bang_usage(text: str, name: str, start: int) -> tuple[int, int] | None:
-    double_regex = re.compile(DOUBLE_BANG_PATTERN.format(name=re.escape(name)))
-    match = double_regex.search(text, start)
-    if match:
-        return line_col(text, match.start())
+def collect_double_bang_usage(
+    text: bytes, nl_positions: list[int], double_bangs: dict[bytes, list[int]], name: bytes, start: int
+) -> tuple[int, int] | None:
+    pos = first_at_or_after(double_bangs.get(name), start)
+    if pos is not None:
+        return line_col(text, nl_positions, pos)
     return None
 
 
-def collect_smart_cast_issues(text: str):
+def collect_smart_cast_issues(text: bytes, nl_positions: list[int], double_bangs: dict[bytes, list[int]]):
     issues = []
     for match in SMART_CAST_PATTERN.finditer(text):
         name = match.group(1)
-        location = collect_double_bang_usage(text, name, match.end())
+        location = collect_double_bang_usage(text, nl_positions, double_bangs, name, match.end())
         if location:
             line, col = location
-            issues.append((line, col, f"{name} forced (!!) after as? smart cast"))
+            issues.append((line, col, f"{name.decode('ascii')} forced (!!) after as? smart cast"))
     return issues
 
 
-def collect_elvis_issues(text: str):
+def collect_elvis_issues(text: bytes, nl_positions: list[int], double_bangs: dict[bytes, list[int]]):
     issues = []
     for match in ELVIS_ASSIGN_PATTERN.finditer(text):
         name = match.group(1)
-        location = collect_double_bang_usage(text, name, match.end())
+        location = collect_double_bang_usage(text, nl_positions, double_bangs, name, match.end())
         if location:
             line, col = location
-            issues.append((line, col, f"{name} assigned via Elvis operator but later forced with !!"))
+            issues.append((line, col, f"{name.decode('ascii')} assigned via Elvis operator but later forced with !!"))
     return issues
 
 
 def analyze_file(path: Path):
-    text = path.read_text(encoding="utf-8", errors="ignore")
-    issues = []
-    # ?. guard: if (x?.prop) { ... }
-    # If block exits, x might be null (if prop was false/null). So x!! is unsafe.
-    # If block continues, x might be null (if prop was false/null). So x!! is unsafe.
-    # So we should NOT skip on exit.
-    issues.extend(collect_guard_issues(text, SAFE_CALL_GUARD_PATTERN, "{name}!! used after ?. guard without exit", skip_on_exit=False))
-    
-    # == null guard: if (x == null) { ... }
-    # If block exits, x is not null. Safe.
-    # If block continues, x is null. Unsafe.
-    # So we SHOULD skip on exit.
-    issues.extend(collect_guard_issues(text, NEGATIVE_GUARD_PATTERN, "{name}!! after non-exiting null guard", skip_on_exit=True))
-    
-    # != null guard: if (x != null) { ... }
-    # If block exits, x is null. Unsafe.
-    # If block continues, x is null. Unsafe.
-    # So we should NOT skip on exit.
-    issues.extend(collect_guard_issues(text, POSITIVE_GUARD_PATTERN, "{name}!! used after '!= null' guard without exit", skip_on_exit=False))
-    
-    issues.extend(collect_smart_cast_issues(text))
-    issues.extend(collect_elvis_issues(text))
+    text = path.read_bytes()
+    # Every finding points at a `!!`; files without one cannot report anything.
+    if b"!!" not in text:
+        return []
+    nl_positions = newline_offsets(text)
+    double_bangs = positions_by_name(DOUBLE_BANG_ANY, text)
+    assigns = positions_by_name(ASSIGN_ANY, text)
+    issues = collect_guard_issues(text, nl_positions, double_bangs, assigns)
+    issues.extend(collect_smart_cast_issues(text, nl_positions, double_bangs))
+    issues.extend(collect_elvis_issues(text, nl_positions, double_bangs))
     deduped = []
     seen = set()
     for line, col, message in issues:
@@ -166,6 +248,127 @@ def analyze_file(path: Path):
     return deduped
 
 
+def analyze_one(path: Path):
+    try:
+        return analyze_file(path)
+    except OSError:
+        return []
+
+
+def map_files(func: Callable[..., T], files: list[Path], *args: object) -> Iterator[T]:
+    """Apply func to each file in order, fanning out to worker processes on larger trees."""
+    if len(files) >= PARALLEL_MIN_FILES:
+        try:
+            executor = ProcessPoolExecutor()
+        except (NotImplementedError, OSError):
+            pass
+        else:
+            chunksize = max(1, len(files) // ((os.cpu_count() or 1) * 4))
+            with executor:
+                yield from executor.map(func, files, *(itertools.repeat(arg) for arg in args), chunksize=chunksize)
+            return
+    for path in files:
+        yield func(path, *args)
+
+
+def _cache_path(root: Path) -> Path | None:
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    # One file per scanned root, so projects sharing a cache directory do not evict each other.
+    root_hash = hashlib.blake2b(os.fsencode(root.resolve()), digest_size=8).hexdigest()
+    return Path(cache_dir) / f"{TOOL_NAME}-{root_hash}.json"
+
+
+def load_cache(root: Path) -> dict[str, dict] | None:
+    """Return root's cached "entries" (content key -> results) and "stats" (stat key -> content key).
+
+    Returns None when caching is disabled.
+    """
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return None
+    empty: dict[str, dict] = {"entries": {}, "stats": {}}
+    try:
+        data = json.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(data, dict) or data.get("salt") != CACHE_SALT:
+        return empty
+    entries, stats = data.get("entries"), data.get("stats")
+    if not isinstance(entries, dict) or not isinstance(stats, dict):
+        return empty
+    return {"entries": entries, "stats": stats}
+
+
+def save_cache(root: Path, entries: dict[str, list], stats: dict[str, str]) -> None:
+    cache_path = _cache_path(root)
+    if cache_path is None:
+        return
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps({"salt": CACHE_SALT, "entries": entries, "stats": stats}), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _digest(*parts: bytes) -> str:
+    return hashlib.blake2b(b"\0".join(parts), digest_size=16).hexdigest()
+
+
+def stat_key(path: Path, context: bytes) -> str | None:
+    """Key a file on its stat; an unchanged stat lets a run trust the cached content key without reading it."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d:%d:%d" % (st.st_size, st.st_mtime_ns, st.st_ctime_ns))
+
+
+def cache_key(path: Path, context: bytes) -> str | None:
+    """Key a file on its size and content, which survive fresh checkouts, chmod and touch."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    return _digest(os.fsencode(path), context, b"%d" % len(data), hashlib.blake2b(data).digest())
+
+
+def map_files_cached(
+    func: Callable[..., list], files: list[Path], *args: object, cache_root: Path
+) -> Iterator[list]:
+    """Like map_files, but replay results for files under cache_root whose contents are unchanged since the last run."""
+    cache = load_cache(cache_root)
+    if cache is None:
+        yield from map_files(func, files, *args)
+        return
+    cached_entries, cached_stats = cache["entries"], cache["stats"]
+    context = repr(args).encode()
+    stat_keys = [stat_key(path, context) for path in files]
+    keys: list[str | None] = []
+    for path, skey in zip(files, stat_keys):
+        key = cached_stats.get(skey) if skey is not None else None
+        if key not in cached_entries:
+            # New stat (fresh checkout, touch, chmod): hash the contents before counting it as a miss.
+            key = cache_key(path, context)
+        keys.append(key)
+    misses = [path for path, key in zip(files, keys) if key not in cached_entries]
+    fresh = map_files(func, misses, *args)
+    entries: dict[str, list] = {}
+    stats: dict[str, str] = {}
+    for skey, key in zip(stat_keys, keys):
+        result = cached_entries[key] if key in cached_entries else next(fresh)
+        if key is not None:
+            entries[key] = result
+            if skey is not None:
+                stats[skey] = key
+        yield result
+    # Only this run's files are kept, so entries for deleted or edited files do not pile up.
+    save_cache(cache_root, entries, stats)
+
+
 def main() -> int:
     if len(sys.argv) < 2:
         print("Usage: type_narrowing_kotlin.py <project_dir>", file=sys.stderr)
@@ -173,13 +376,12 @@ def main() -> int:
     root = Path(sys.argv[1]).resolve()
     if not root.exists():
         return 0
-    for path in iter_kotlin_files(root):
-        try:
-            issues = analyze_file(path)
-        except OSError:
-            continue
-        for line, col, message in issues:
-            print(f"{path}:{line}:{col}\t{message}")
+    files = sorted(iter_kotlin_files(root), key=str)
+    write = sys.stdout.write
+    # Results come first in zip() so the cached generator is drained and gets to save its cache.
+    for issues, path in zip(map_files_cached(analyze_one, files, cache_root=root), files):
+        if issues:
+            write("".join(f"{path}:{line}:{col}\t{message}\n" for line, col, message in issues))
     return 0
 
 
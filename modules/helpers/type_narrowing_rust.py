@@ -1,20 +1,49 @@
 #!/usr/bin/env python3
-"""Detect Rust guard clauses that still unwrap the guarded Option/Result later."""
+"""Detect Rust guard clauses that still unwrap the guarded Option/Result later.
+
+ast-grep JSONL is parsed with `orjson` when it is installed, otherwise with the stdlib `json`.
+"""
 from __future__ import annotations
 
-import json
 import os
 import re
 import sys
-from json import JSONDecodeError
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads  # type: ignore[assignment]
 
 SKIP_DIRS = {"target", ".git", ".hg", ".svn", "node_modules"}
-UNWRAP_PATTERN = r"\b{name}\s*\.(?:unwrap|expect)\s*\("
-ASSIGN_PATTERN = r"\b{name}\s*="
+# Reassignment or unwrap/expect of the guarded name; whichever comes first decides the guard.
+USE_BODY = rb"%s\s*(?:(?P<assign>=)|\.(?:unwrap|expect)\s*\()"
+USE_PATTERN = rb"\b" + USE_BODY
 IDENT_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+NEWLINE_PATTERN = re.compile(rb"\n")
+BRACE_PATTERN = re.compile(rb"[{}]")
+OPEN_BRACE = ord("{")
+# Below this many files (or guards, for --ast-json) the process pool start-up costs more than it saves.
+PARALLEL_MIN_FILES = 32
+PARALLEL_MIN_GUARDS = 100
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=4096)
+def use_regex(name: bytes) -> re.Pattern[bytes]:
+    return re.compile(USE_PATTERN % re.escape(name))
+
+
+@lru_cache(maxsize=4096)
+def use_at_regex(name: bytes) -> re.Pattern[bytes]:
+    """USE_PATTERN without the leading \\b, for a use that starts exactly at a guard end."""
+    return re.compile(USE_BODY % re.escape(name))
 
 
 @dataclass(frozen=True)
@@ -33,27 +62,23 @@ def is_safe_path(path: Path, base: Path) -> bool:
         return False
 
 
-def read_file(path: Path, cache: dict[Path, str]) -> str:
-    if path not in cache:
-        cache[path] = path.read_text(encoding="utf-8", errors="ignore")
-    return cache[path]
-
-
-def safe_json_loads(line: str) -> dict | None:
+def safe_json_loads(line: bytes) -> dict | None:
     try:
-        payload = json.JSONDecoder().decode(line)
-    except JSONDecodeError:
+        payload = json_loads(line)
+    except ValueError:  # JSONDecodeError from either parser, or undecodable bytes
         return None
     return payload if isinstance(payload, dict) else None
 
 
-def line_col(text: str, pos: int) -> tuple[int, int]:
-    line = text.count("\n", 0, pos) + 1
-    last_newline = text.rfind("\n", 0, pos)
-    if last_newline == -1:
-        col = pos + 1
-    else:
-        col = pos - last_newline
+def newline_positions(text: bytes) -> list[int]:
+    return [match.start() for match in NEWLINE_PATTERN.finditer(text)]
+
+
+def line_col(text: bytes, nl_positions: list[int], pos: int) -> tuple[int, int]:
+    """Return the 1-based line and character (not byte) column of a byte offset."""
+    line = bisect_left(nl_positions, pos) + 1
+    line_start = nl_positions[line - 2] + 1 if line > 1 else 0
+    col = len(text[line_start:pos].decode("utf-8", errors="ignore")) + 1
     return line, col
 
 
@@ -64,32 +89,22 @@ def iter_rust_files(root: Path) -> Iterable[Path]:
             yield root
         return
 
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Modify dirnames in-place to prune traversal
-        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
-
-        for filename in filenames:
-            if filename.endswith(".rs"):
-                path = Path(dirpath) / filename
-                if is_safe_path(path, base):
-                    yield path
-
-
-def analyze_guard(text: str, guard: GuardMatch) -> tuple[int, int] | None:
-    # For 'if let Some', exiting the block means we only reach the unwrap if None (panic).
-    # Continuing means we reach it in both cases (panic if None).
-    # So we don't check EXIT_PATTERN here.
-    remainder = text[guard.end :]
-    assign_match = re.search(ASSIGN_PATTERN.format(name=re.escape(guard.expr)), remainder)
-    search_region = remainder
-    if assign_match:
-        search_region = remainder[: assign_match.start()]
-    unwrap_regex = re.compile(UNWRAP_PATTERN.format(name=re.escape(guard.expr)))
-    unwrap_match = unwrap_regex.search(search_region)
-    if not unwrap_match:
-        return None
-    absolute_pos = guard.end + unwrap_match.start()
-    return line_col(text, absolute_pos)
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    # Directory symlinks are never followed, so only symlinked files can point outside root.
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(".rs"):
+                        path = Path(entry.path)
+                        if not entry.is_symlink() or is_safe_path(path, base):
+                            yield path
+        except OSError:
+            continue
 
 
 def guard_from_match(entry: dict) -> GuardMatch | None:
@@ -109,6 +124,54 @@ def guard_from_match(entry: dict) -> GuardMatch | None:
     return GuardMatch(Path(file_path), expr, int(start), int(end))
 
 
+def analyze_guard_file(path: Path, guards: list[GuardMatch]) -> list[tuple[int, int] | None]:
+    """Analyze every guard in one file, reading it once; results line up with guards."""
+    try:
+        text = path.read_bytes()
+    except OSError:
+        return [None] * len(guards)
+    nl_positions = newline_positions(text)
+    indices_by_expr: dict[str, list[int]] = {}
+    for idx, guard in enumerate(guards):
+        indices_by_expr.setdefault(guard.expr, []).append(idx)
+    locations: list[tuple[int, int] | None] = [None] * len(guards)
+    # For 'if let Some', exiting the block means we only reach the unwrap if None (panic).
+    # Continuing means we reach it in both cases (panic if None).
+    # So we don't check EXIT_PATTERN here; the first use after the guard decides it.
+    for expr, indices in indices_by_expr.items():
+        name = expr.encode()
+        # One pass per name; each guard then bisects to the first use at or after its end.
+        uses = list(use_regex(name).finditer(text))
+        use_starts = [use.start() for use in uses]
+        use_at = use_at_regex(name)
+        for idx in indices:
+            end = guards[idx].end
+            # A use right at the end counts even when a word character precedes it, like the old
+            # search over text[end:] did; uses cannot overlap, so the bisect finds every other one.
+            use_match = use_at.match(text, end)
+            if use_match is None:
+                pos = bisect_left(use_starts, end)
+                use_match = uses[pos] if pos < len(uses) else None
+            if use_match and not use_match.group("assign"):
+                locations[idx] = line_col(text, nl_positions, use_match.start())
+    return locations
+
+
+def map_files(func: Callable[..., T], files: list[Path], *per_file: list, parallel: bool) -> Iterator[T]:
+    """Apply func to each file and its per-file arguments in order, optionally in worker processes."""
+    if parallel:
+        try:
+            executor = ProcessPoolExecutor()
+        except (NotImplementedError, OSError):
+            pass
+        else:
+            chunksize = max(1, len(files) // ((os.cpu_count() or 1) * 4))
+            with executor:
+                yield from executor.map(func, files, *per_file, chunksize=chunksize)
+            return
+    yield from map(func, files, *per_file)
+
+
 def analyze_with_ast_json(root: Path, json_path: Path) -> List[tuple[Path, int, int, str]]:
     base = root.resolve()
     base_dir = base if base.is_dir() else base.parent
@@ -116,38 +179,44 @@ def analyze_with_ast_json(root: Path, json_path: Path) -> List[tuple[Path, int,
         return []
     guards: List[GuardMatch] = []
     try:
-        with json_path.open(encoding="utf-8") as fh:
-            for line in fh:
-                line = line.strip()
-                if not line:
-                    continue
-                match = safe_json_loads(line)
-                if match is None:
-                    continue
-                guard = guard_from_match(match)
-                if not guard:
-                    continue
-                guard_path = guard.path
-                if not guard_path.is_absolute():
-                    guard_path = (base_dir / guard_path).resolve()
-                else:
-                    guard_path = guard_path.resolve()
-                guard = GuardMatch(guard_path, guard.expr, guard.start, guard.end)
-                if is_safe_path(guard.path, base_dir):
-                    guards.append(guard)
+        lines = json_path.read_bytes().splitlines()
     except OSError:
         return []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        match = safe_json_loads(line)
+        if match is None:
+            continue
+        guard = guard_from_match(match)
+        if not guard:
+            continue
+        guard_path = guard.path
+        if not guard_path.is_absolute():
+            guard_path = (base_dir / guard_path).resolve()
+        else:
+            guard_path = guard_path.resolve()
+        guard = GuardMatch(guard_path, guard.expr, guard.start, guard.end)
+        if is_safe_path(guard.path, base_dir):
+            guards.append(guard)
     if not guards:
         return []
 
-    cache: dict[Path, str] = {}
+    # Group guards by file so each file is read once, then put results back in guard order.
+    indices_by_path: dict[Path, list[int]] = {}
+    for idx, guard in enumerate(guards):
+        indices_by_path.setdefault(guard.path, []).append(idx)
+    paths = list(indices_by_path)
+    groups = [[guards[idx] for idx in indices_by_path[path]] for path in paths]
+    parallel = len(guards) >= PARALLEL_MIN_GUARDS and len(paths) > 1
+    locations: list[tuple[int, int] | None] = [None] * len(guards)
+    for group_locations, path in zip(map_files(analyze_guard_file, paths, groups, parallel=parallel), paths):
+        for idx, loc in zip(indices_by_path[path], group_locations):
+            locations[idx] = loc
+
     findings: List[tuple[Path, int, int, str]] = []
-    for guard in guards:
-        try:
-            text = read_file(guard.path, cache)
-        except OSError:
-            continue
-        loc = analyze_guard(text, guard)
+    for guard, loc in zip(guards, locations):
         if not loc:
             continue
         line, col = loc
@@ -156,16 +225,17 @@ def analyze_with_ast_json(root: Path, json_path: Path) -> List[tuple[Path, int,
 
 
 # Legacy regex fallback ----------------------------------------------------- #
-GUARD_PATTERN = re.compile(r"if\s+let\s+(?:Some|Ok)\s*\([^)]*\)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)\s*\{", re.MULTILINE)
+GUARD_PATTERN = re.compile(rb"if\s+let\s+(?:Some|Ok)\s*\([^)]*\)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)\s*\{", re.MULTILINE)
 
 
-def find_block_end(text: str, start: int) -> int:
+def find_block_end(text: bytes, start: int) -> int:
     depth = 0
-    for idx in range(start, len(text)):
-        ch = text[idx]
-        if ch == "{":
+    # Only visit the braces themselves; the scan between them happens in C.
+    for match in BRACE_PATTERN.finditer(text, start):
+        idx = match.start()
+        if text[idx] == OPEN_BRACE:
             depth += 1
-        elif ch == "}":
+        else:
             depth -= 1
             if depth == 0:
                 return idx
@@ -173,11 +243,15 @@ def find_block_end(text: str, start: int) -> int:
 
 
 def analyze_file_regex(path: Path) -> List[tuple[int, int, str]]:
-    text = path.read_text(encoding="utf-8", errors="ignore")
+    text = path.read_bytes()
     issues: List[tuple[int, int, str]] = []
+    # A finding needs an `if let` guard (whitespace may vary) and a later unwrap/expect.
+    if b"let" not in text or (b"unwrap" not in text and b"expect" not in text):
+        return issues
+    nl_positions = newline_positions(text)
     for match in GUARD_PATTERN.finditer(text):
         expr = match.group(1)
-        brace_start = text.find("{", match.start())
+        brace_start = text.find(b"{", match.start())
         if brace_start == -1:
             continue
         brace_end = find_block_end(text, brace_start)
@@ -186,24 +260,26 @@ def analyze_file_regex(path: Path) -> List[tuple[int, int, str]]:
         remainder = text[brace_end + 1 :]
         if not remainder.strip():
             continue
-        assign_match = re.search(ASSIGN_PATTERN.format(name=re.escape(expr)), remainder)
-        search_region = remainder if not assign_match else remainder[: assign_match.start()]
-        unwrap_regex = re.compile(UNWRAP_PATTERN.format(name=re.escape(expr)))
-        unwrap_match = unwrap_regex.search(search_region)
-        if unwrap_match:
-            absolute_pos = brace_end + 1 + unwrap_match.start()
-            line, col = line_col(text, absolute_pos)
-            issues.append((line, col, f"{expr} unwrap/expect after partial guard"))
+        use_match = use_regex(expr).search(remainder)
+        if use_match and not use_match.group("assign"):
+            absolute_pos = brace_end + 1 + use_match.start()
+            line, col = line_col(text, nl_positions, absolute_pos)
+            issues.append((line, col, f"{expr.decode()} unwrap/expect after partial guard"))
     return issues
 
 
+def analyze_one(path: Path) -> List[tuple[int, int, str]]:
+    try:
+        return analyze_file_regex(path)
+    except OSError:
+        return []
+
+
 def analyze_with_regex(root: Path) -> List[tuple[Path, int, int, str]]:
     findings: List[tuple[Path, int, int, str]] = []
-    for path in iter_rust_files(root):
-        try:
-            issues = analyze_file_regex(path)
-        except OSError:
-            continue
+    files = sorted(iter_rust_files(root), key=str)
+    parallel = len(files) >= PARALLEL_MIN_FILES
+    for issues, path in zip(map_files(analyze_one, files, parallel=parallel), files):
         for line, col, msg in issues:
             findings.append((path, line, col, msg))
     return findings
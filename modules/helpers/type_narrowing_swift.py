@@ -4,20 +4,32 @@ from __future__ import annotations
 
 import re
 import sys
+from bisect import bisect_left
+from functools import lru_cache
 from pathlib import Path
 
 SKIP_DIRS = {".git", ".hg", ".svn", "build", "DerivedData", ".swiftpm", ".idea", "node_modules"}
-GUARD_PATTERN = re.compile(r"guard\s+let\s+([A-Za-z_][\w]*)\s*=\s*[^\n]+\s+else\s*\{", re.MULTILINE)
-NEGATIVE_NIL_GUARD = re.compile(r"if\s*\(?\s*([A-Za-z_][\w]*)\s*==\s*nil[^)\{]*\)?", re.MULTILINE)
-POSITIVE_NIL_GUARD = re.compile(r"if\s*\(?\s*([A-Za-z_][\w]*)\s*!=\s*nil[^)\{]*\)?", re.MULTILINE)
-OPTIONAL_CHAIN_GUARD = re.compile(r"if\s*\(?\s*([A-Za-z_][\w]*)\s*\?\.[^)\{]*\)?", re.MULTILINE)
-FORCE_TEMPLATE = r"{name}\s*!"
-ASSIGN_TEMPLATE = r"{name}\s*="
-COMMENT_PATTERN = re.compile(r"//.*?$|/\*.*?\*/", re.MULTILINE | re.DOTALL)
-EXIT_PATTERN = re.compile(
-    r"\b(?:return|throw|break|continue)\b|\b(?:fatalError|preconditionFailure)\b",
-    re.IGNORECASE,
-)
+GUARD_PATTERN = re.compile(rb"guard\s+let\s+([A-Za-z_][\w]*)\s*=\s*[^\n]+\s+else\s*\{", re.MULTILINE)
+NEGATIVE_NIL_GUARD = re.compile(rb"if\s*\(?\s*([A-Za-z_][\w]*)\s*==\s*nil[^)\{]*\)?", re.MULTILINE)
+POSITIVE_NIL_GUARD = re.compile(rb"if\s*\(?\s*([A-Za-z_][\w]*)\s*!=\s*nil[^)\{]*\)?", re.MULTILINE)
+OPTIONAL_CHAIN_GUARD = re.compile(rb"if\s*\(?\s*([A-Za-z_][\w]*)\s*\?\.[^)\{]*\)?", re.MULTILINE)
+# Reassignment or force-unwrap of the guarded name; whichever comes first decides the guard.
+USE_TEMPLATE = rb"%s\s*(?:(?P<assign>=)|!)"
+COMMENT_PATTERN = re.compile(rb"//.*?$|/\*.*?\*/", re.MULTILINE | re.DOTALL)
+NEWLINE_PATTERN = re.compile(rb"\n")
+WHITESPACE_PATTERN = re.compile(rb"\s*")
+EXIT_PATTERN = re.compile(rb"\b(?:return|throw|break|continue|fatalError|preconditionFailure)\b", re.IGNORECASE)
+# Lowercased to match EXIT_PATTERN's IGNORECASE against block.lower().
+EXIT_LITERALS = (b"return", b"throw", b"break", b"continue", b"fatalerror", b"preconditionfailure")
+# On longer blocks a few memmem scans rule out exit-free bodies faster than the \b regex can.
+EXIT_PREFILTER_MIN_BYTES = 256
+BRACE_PATTERN = re.compile(rb"[{}]")
+OPEN_BRACE = ord("{")
+
+
+@lru_cache(maxsize=4096)
+def use_regex(name: bytes) -> re.Pattern[bytes]:
+    return re.compile(USE_TEMPLATE % re.escape(name))
 
 
 def iter_swift_files(root: Path):
@@ -32,94 +44,95 @@ def iter_swift_files(root: Path):
             yield path
 
 
-def find_block_end(text: str, brace_start: int) -> int:
+def find_block_end(text: bytes, brace_start: int) -> int:
     depth = 0
-    for idx in range(brace_start, len(text)):
-        ch = text[idx]
-        if ch == "{":
+    # Only visit the braces themselves; the scan between them happens in C.
+    for match in BRACE_PATTERN.finditer(text, brace_start):
+        idx = match.start()
+        if text[idx] == OPEN_BRACE:
             depth += 1
-        elif ch == "}":
+        else:
             depth -= 1
             if depth == 0:
                 return idx
     return len(text) - 1
 
 
-def block_has_exit(block: str) -> bool:
-    stripped = COMMENT_PATTERN.sub("", block)
-    return bool(EXIT_PATTERN.search(stripped))
+def block_has_exit(block: bytes) -> bool:
+    # Most guard bodies have no comments, so only pay for the DOTALL comment pass when one is present.
+    if b"//" in block or b"/*" in block:
+        block = COMMENT_PATTERN.sub(b"", block)
+    if len(block) >= EXIT_PREFILTER_MIN_BYTES:
+        lowered = block.lower()
+        if not any(word in lowered for word in EXIT_LITERALS):
+            return False
+    return EXIT_PATTERN.search(block) is not None
 
 
-def line_col(text: str, pos: int) -> tuple[int, int]:
-    line = text.count("\n", 0, pos) + 1
-    last_newline = text.rfind("\n", 0, pos)
-    if last_newline == -1:
-        col = pos + 1
-    else:
-        col = pos - last_newline
+def line_col(text: bytes, nl_positions: list[int], pos: int) -> tuple[int, int]:
+    """Return the 1-based line and character (not byte) column of a byte offset."""
+    line = bisect_left(nl_positions, pos) + 1
+    line_start = nl_positions[line - 2] + 1 if line > 1 else 0
+    col = len(text[line_start:pos].decode("utf-8", errors="ignore")) + 1
     return line, col
 
 
-def skip_ws(text: str, idx: int) -> int:
-    while idx < len(text) and text[idx].isspace():
-        idx += 1
-    return idx
+def skip_ws(text: bytes, idx: int) -> int:
+    match = WHITESPACE_PATTERN.match(text, idx)
+    return match.end() if match else idx
 
 
-def extract_guard_region(text: str, match_end: int) -> tuple[str, int]:
+def extract_guard_region(text: bytes, match_end: int) -> tuple[bytes, int]:
     idx = skip_ws(text, match_end)
-    if idx < len(text) and text[idx] == "{":
+    if idx < len(text) and text[idx] == OPEN_BRACE:
         block_end = find_block_end(text, idx)
         return text[idx : block_end + 1], block_end + 1
-    newline = text.find("\n", idx)
+    newline = text.find(b"\n", idx)
     if newline == -1:
         newline = len(text)
     return text[idx:newline], newline
 
 
-def collect_guard_issues(text: str, pattern: re.Pattern[str], message: str, skip_on_exit: bool = True):
+def collect_guard_issues(
+    text: bytes, nl_positions: list[int], pattern: re.Pattern[bytes], message: str, skip_on_exit: bool = True
+):
     issues = []
     for match in pattern.finditer(text):
         name = match.group(1)
         block_text, guard_end = extract_guard_region(text, match.end())
         if skip_on_exit and block_has_exit(block_text):
             continue
-        assign_regex = re.compile(ASSIGN_TEMPLATE.format(name=re.escape(name)))
-        force_regex = re.compile(FORCE_TEMPLATE.format(name=re.escape(name)))
-        search_from = guard_end
-        while True:
-            force_match = force_regex.search(text, search_from)
-            if not force_match:
-                break
-            assign_match = assign_regex.search(text, search_from, force_match.start())
-            if assign_match:
-                break
-            line, col = line_col(text, force_match.start())
-            issues.append((line, col, message.format(name=name)))
-            break
+        use_match = use_regex(name).search(text, guard_end)
+        if use_match and not use_match.group("assign"):
+            line, col = line_col(text, nl_positions, use_match.start())
+            issues.append((line, col, message.format(name=name.decode())))
     return issues
 
 
 def analyze_file(path: Path):
-    text = path.read_text(encoding="utf-8", errors="ignore")
-    issues = []
+    text = path.read_bytes()
+    issues: list[tuple[int, int, str]] = []
+    # `guard let` findings need `guard`; nil/?. guard findings also need a later force unwrap.
+    if b"guard" not in text and (b"!" not in text or (b"nil" not in text and b"?." not in text)):
+        return issues
+    nl_positions = [match.start() for match in NEWLINE_PATTERN.finditer(text)]
     # == nil: if (x == nil) { return } -> x! is safe. Skip on exit.
-    issues.extend(collect_guard_issues(text, NEGATIVE_NIL_GUARD, "{name}! used after == nil guard without exit", skip_on_exit=True))
+    issues.extend(collect_guard_issues(text, nl_positions, NEGATIVE_NIL_GUARD, "{name}! used after == nil guard without exit", skip_on_exit=True))
     
     # != nil: if (x != nil) { return } -> x! is unsafe (guaranteed crash). Don't skip.
-    issues.extend(collect_guard_issues(text, POSITIVE_NIL_GUARD, "{name}! used after '!= nil' guard without exit", skip_on_exit=False))
+    issues.extend(collect_guard_issues(text, nl_positions, POSITIVE_NIL_GUARD, "{name}! used after '!= nil' guard without exit", skip_on_exit=False))
     
     # ?. : if (x?.p) { return } -> x! is unsafe. Don't skip.
-    issues.extend(collect_guard_issues(text, OPTIONAL_CHAIN_GUARD, "{name}! forced after ?. guard without exit", skip_on_exit=False))
+    issues.extend(collect_guard_issues(text, nl_positions, OPTIONAL_CHAIN_GUARD, "{name}! forced after ?. guard without exit", skip_on_exit=False))
     
     for match in GUARD_PATTERN.finditer(text):
-        name = match.group(1)
+        name = match.group(1).decode()
         brace_start = max(match.end() - 1, match.start())
         block_end = find_block_end(text, brace_start)
         block_text = text[brace_start : block_end + 1]
         if block_has_exit(block_text):
             continue
-        line, col = line_col(text, match.start())
+        line, col = line_col(text, nl_positions, match.start())
         message = f"guard let '{name}' else-block does not exit before continuing"
         issues.append((line, col, message))
     return issues
@@ -2,6 +2,8 @@
 """Regression tests for the Java resource lifecycle helper."""
 from __future__ import annotations
 
+import importlib.util
+import os
 import shutil
 import subprocess
 import sys
@@ -9,6 +11,7 @@ import tempfile
 import textwrap
 import unittest
 from pathlib import Path
+from unittest import mock
 
 REPO_ROOT = Path(__file__).resolve().parents[3]
 HELPER = REPO_ROOT / "modules" / "helpers" / "resource_lifecycle_java.py"
@@ -123,6 +126,122 @@ class JavaResourceHelperTests(unittest.TestCase):
         )
         self.assertEqual(lines, [])
 
+    def test_result_cache_hits_after_touch(self) -> None:
+        spec = importlib.util.spec_from_file_location("resource_lifecycle_java", HELPER)
+        assert spec and spec.loader
+        helper = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(helper)
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-java-helper-"))
+        try:
+            project = temp_dir / "project"
+            project.mkdir()
+            source = project / "Leak.java"
+            source.write_text("class Leak { void bad(Connection c) { Statement s = c.createStatement(); } }\n")
+            analyzed: list[str] = []
+
+            def analyze(path: Path, root: Path) -> list:
+                analyzed.append(path.name)
+                return helper.analyze_file(path, root)
+
+            with mock.patch.dict(os.environ, {"UBS_HELPER_CACHE_DIR": str(temp_dir / "cache")}):
+                first = list(helper.map_files_cached(analyze, [source], project, cache_root=project))
+                # A fresh checkout or chmod changes mtime/ctime but not the contents, so the result is replayed.
+                os.utime(source, ns=(1, 1))
+                source.chmod(0o600)
+                second = list(helper.map_files_cached(analyze, [source], project, cache_root=project))
+            self.assertEqual(analyzed, ["Leak.java"])
+            self.assertEqual([[list(issue) for issue in issues] for issues in first], second)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_latin1_sources_are_scanned(self) -> None:
+        # Exercises the RE2 declaration patterns whenever google-re2 is installed.
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-java-helper-"))
+        try:
+            (temp_dir / "Latin.java").write_bytes(
+                b"class Latin {\n"
+                b"    void bad(Connection c) throws Exception { Statement s = c.createStatement(na\xefve); }\n"
+                b"}\n"
+            )
+            result = subprocess.run(
+                [sys.executable, str(HELPER), str(temp_dir)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            self.assertEqual(result.stdout.splitlines(), ["Latin.java:2\tstatement_handle"])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_skipped_directories_are_not_scanned(self) -> None:
+        leak = """
+        import java.sql.*;
+        class Leak {
+            void bad(Connection conn) throws Exception {
+                Statement stmt = conn.createStatement();
+            }
+        }
+        """
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-java-helper-"))
+        try:
+            for rel in ("src/Leak.java", "build/generated/Leak.java", "node_modules/pkg/Leak.java", "shared/A.java"):
+                path = temp_dir / rel
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(textwrap.dedent(leak), encoding="utf-8")
+            # Symlinked source files are scanned; symlinked directories are not followed.
+            (temp_dir / "src" / "Link.java").symlink_to(Path("..") / "shared" / "A.java")
+            (temp_dir / "src" / "linked_dir").symlink_to(Path("..") / "shared", target_is_directory=True)
+            result = subprocess.run(
+                [sys.executable, str(HELPER), str(temp_dir)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            lines = sorted(line.split(":", 1)[0] for line in result.stdout.splitlines() if line.strip())
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self.assertEqual(lines, ["shared/A.java", "src/Leak.java", "src/Link.java"])
+
+    def test_result_cache_replays_unchanged_files(self) -> None:
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-java-helper-"))
+        try:
+            project = temp_dir / "project"
+            project.mkdir()
+            source = project / "Leak.java"
+            source.write_text(
+                "class Leak { void bad(Connection conn) { Statement stmt = conn.createStatement(); } }\n",
+                encoding="utf-8",
+            )
+            env = dict(os.environ, UBS_HELPER_CACHE_DIR=str(temp_dir / "cache"))
+
+            def run() -> list[str]:
+                result = subprocess.run(
+                    [sys.executable, str(HELPER), str(project)],
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                    env=env,
+                )
+                return result.stdout.splitlines()
+
+            first = run()
+            self.assertEqual(first, ["Leak.java:1\tstatement_handle"])
+            self.assertEqual(len(list((temp_dir / "cache").glob("resource_lifecycle_java-*.json"))), 1)
+            self.assertEqual(run(), first)
+            other = temp_dir / "other"
+            other.mkdir()
+            (other / "Ok.java").write_text("class Ok {}\n", encoding="utf-8")
+            subprocess.run([sys.executable, str(HELPER), str(other)], capture_output=True, check=False, env=env)
+            # A second project sharing the cache directory gets its own file instead of replacing this one.
+            self.assertEqual(len(list((temp_dir / "cache").glob("resource_lifecycle_java-*.json"))), 2)
+            source.write_text(
+                "class Leak { void ok(Connection conn) { Statement stmt = conn.createStatement(); stmt.close(); } }\n",
+                encoding="utf-8",
+            )
+            self.assertEqual(run(), [])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
 
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
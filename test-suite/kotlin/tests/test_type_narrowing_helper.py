@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Regression tests for the Kotlin type narrowing helper."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+HELPER = REPO_ROOT / "modules" / "helpers" / "type_narrowing_kotlin.py"
+
+
+class KotlinTypeNarrowingHelperTests(unittest.TestCase):
+    def run_helper(self, sources: dict[str, bytes]) -> list[str]:
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-kotlin-helper-"))
+        try:
+            for rel, code in sources.items():
+                path = temp_dir / rel
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(code)
+            result = subprocess.run(
+                [sys.executable, str(HELPER), str(temp_dir)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            prefix = f"{temp_dir.resolve()}/"
+            return [line.replace(prefix, "") for line in result.stdout.splitlines() if line.strip()]
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_uses_and_reassignments_match_whole_names(self) -> None:
+        lines = self.run_helper(
+            {
+                "Names.kt": (
+                    b"fun a(foo: String?, foobar: String?, myfoo: String?) {\n"
+                    b"    if (foo == null) { println(\"missing\") }\n"
+                    b"    foobar!!.length\n"
+                    b"    myfoo!!.length\n"
+                    b"}\n"
+                    b"\n"
+                    b"fun b(foo: String?) {\n"
+                    b"    if (foo == null) { println(\"missing\") }\n"
+                    b"    myfoo = \"x\"\n"
+                    b"    foo!!.length\n"
+                    b"}\n"
+                ),
+            }
+        )
+        # foobar!!/myfoo!! are not uses of foo, and assigning myfoo does not reassign foo.
+        self.assertEqual(lines, ["Names.kt:10:5\tfoo!! after non-exiting null guard"])
+
+    def test_latin1_guard_is_reported(self) -> None:
+        # Exercises the RE2 guard pattern whenever google-re2 is installed.
+        lines = self.run_helper(
+            {
+                "Latin.kt": (
+                    b"fun f(x: String?, y: String) {\n"
+                    b"    if (x == null && y == \"na\xefve\") { println(y) }\n"
+                    b"    x!!.length\n"
+                    b"}\n"
+                ),
+            }
+        )
+        self.assertEqual(lines, ["Latin.kt:3:5\tx!! after non-exiting null guard"])
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -2,6 +2,7 @@
 """Regression tests for helper-backed resource lifecycle analyzers."""
 from __future__ import annotations
 
+import os
 import shutil
 import subprocess
 import sys
@@ -165,6 +166,49 @@ class ResourceHelperTests(unittest.TestCase):
         )
         self.assertEqual(lines, [])
 
+    def test_non_utf8_sources_are_analyzed_or_skipped_with_a_warning(self) -> None:
+        tmpdir = Path(tempfile.mkdtemp(prefix="ubs-resource-helper-"))
+        try:
+            # A coding cookie makes Latin-1 valid; without one the file is skipped with a warning, not a crash.
+            (tmpdir / "latin.py").write_bytes(b'# -*- coding: latin-1 -*-\nname = "na\xefve"\nfh = open(name)\n')
+            (tmpdir / "broken.py").write_bytes(b'name = "na\xefve"\nfh = open(name)\n')
+            (tmpdir / "ok.py").write_text('fh = open("x")\n', encoding="utf-8")
+            result = subprocess.run(
+                [sys.executable, str(PYTHON_HELPER), str(tmpdir)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("WARN: Syntax error in", result.stderr)
+        self.assertIn("broken.py", result.stderr)
+        entries = parse(result.stdout.splitlines())
+        self.assertEqual(
+            [(path, kind) for path, kind, _ in entries],
+            [("latin.py:3", "file_handle"), ("ok.py:1", "file_handle")],
+        )
+
+    def test_cache_repeats_syntax_warnings(self) -> None:
+        tmpdir = Path(tempfile.mkdtemp(prefix="ubs-resource-helper-"))
+        try:
+            project = tmpdir / "project"
+            project.mkdir()
+            (project / "broken.py").write_text("fh = open('x')\ndef broken(:\n", encoding="utf-8")
+            env = dict(os.environ, UBS_HELPER_CACHE_DIR=str(tmpdir / "cache"))
+            for _ in range(2):
+                result = subprocess.run(
+                    [sys.executable, str(PYTHON_HELPER), str(project)],
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                    env=env,
+                )
+                self.assertIn("WARN: Syntax error in", result.stderr)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
     def test_ruby_helper_reports_resource_leaks(self) -> None:
         lines = run_helper(
             RUBY_HELPER,
@@ -167,10 +167,17 @@ from run_manifest import (  # noqa: E402,F401
     parse_module_text_summary,
     parse_text_summary,
     parse_toon_summary,
-    timeout_output,
 )
 
 
+def timeout_output(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
 def enable_line_buffered_stdout() -> None:
     reconfigure = getattr(sys.stdout, "reconfigure", None)
     if callable(reconfigure):
@@ -111,6 +111,8 @@ if command -v uv >/dev/null 2>&1; then
   uv run python shareable/test_skip_categories.py
   uv run python python/tests/test_resource_helper.py
   uv run python java/tests/test_resource_lifecycle_helper.py
+  uv run python kotlin/tests/test_type_narrowing_helper.py
+  uv run python rust/tests/test_type_narrowing_helper.py
   uv run python csharp/tests/test_helper_scanners.py
 else
   echo "[warn] uv not found – falling back to system python3. Run 'uv sync --python 3.13' for the supported toolchain." >&2
@@ -122,5 +124,7 @@ else
   python3 shareable/test_skip_categories.py
   python3 python/tests/test_resource_helper.py
   python3 java/tests/test_resource_lifecycle_helper.py
+  python3 kotlin/tests/test_type_narrowing_helper.py
+  python3 rust/tests/test_type_narrowing_helper.py
   python3 csharp/tests/test_helper_scanners.py
 fi
@@ -21,12 +21,25 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_MANIFEST = Path(__file__).with_name("manifest.json")
 JSON_DECODER = json.JSONDecoder()
 SUMMARY_COUNT_KEYS = ("files", "critical", "warning", "info")
-EXPECT_SUBSTRING_KEYS = (
-    "require_substrings",
-    "forbid_substrings",
-    "require_substrings_stderr",
-    "forbid_substrings_stderr",
+# raw_decode does not skip leading whitespace, so only lines that begin with "{" can hold an object.
+JSON_LINE_START = re.compile(r"^\{", re.MULTILINE)
+TEXT_SUMMARY_MARKER = "──────── Combined Summary"
+MODULE_SUMMARY_MARKER = "Summary Statistics:"
+# Both summaries print their counts in this order, so one search captures all four.
+SUMMARY_RE = re.compile(r"Files:\s+(\d+).*?Critical:\s+(\d+).*?Warning:\s+(\d+).*?Info:\s+(\d+)", re.DOTALL)
+MODULE_SUMMARY_RE = re.compile(
+    r"Files scanned:\s+(\d+).*?Critical issues:\s+(\d+).*?Warning issues:\s+(\d+).*?Info items:\s+(\d+)",
+    re.DOTALL,
 )
+# (expect key, stream, must be present); str "in" beats a combined alternation regex on large output.
+SUBSTRING_EXPECTATIONS = (
+    ("require_substrings", "stdout", True),
+    ("forbid_substrings", "stdout", False),
+    ("require_substrings_stderr", "stderr", True),
+    ("forbid_substrings_stderr", "stderr", False),
+)
+EXPECT_SUBSTRING_KEYS = tuple(key for key, _, _ in SUBSTRING_EXPECTATIONS)
+STDERR_EXPECT_KEYS = tuple(key for key, stream, _ in SUBSTRING_EXPECTATIONS if stream == "stderr")
 
 
 def load_manifest(path: Path) -> Dict[str, Any]:
@@ -275,66 +288,56 @@ def extract_json_from_stdout(stdout: str) -> Optional[Dict[str, Any]]:
     objects are treated as noise so malformed summaries cannot satisfy manifest
     expectations by accident.
     """
-    decoder = json.JSONDecoder()
-    lines = stdout.splitlines()
-    for idx, line in enumerate(lines):
-        if line.strip().startswith("{"):
-            candidate = "\n".join(lines[idx:])
-            try:
-                # raw_decode stops at end of JSON, ignoring trailing content
-                obj, _ = decoder.raw_decode(candidate)
-                if isinstance(obj, dict):
-                    if is_ubs_summary_object(obj):
-                        return obj
-                    if "ruleId" in obj or ("severity" in obj and "message" in obj):
-                        continue
-            except json.JSONDecodeError:
-                continue
+    # Plain text reports usually have no line-start brace; skip the regex scan for them.
+    if not stdout.startswith("{") and "\n{" not in stdout:
+        return None
+    for match in JSON_LINE_START.finditer(stdout):
+        try:
+            # raw_decode parses in place from the line start and stops at the end of the object
+            obj, _ = JSON_DECODER.raw_decode(stdout, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, dict) and is_ubs_summary_object(obj):
+            return obj
     return None
 
 
 def parse_text_summary(stdout: str, project_label: str) -> Optional[Dict[str, Any]]:
-    marker = "──────── Combined Summary"
-    if marker not in stdout:
+    start = stdout.find(TEXT_SUMMARY_MARKER)
+    if start < 0:
         return None
-    block = stdout.split(marker, 1)[-1]
-    files = re.search(r"Files:\s+(\d+)", block)
-    critical = re.search(r"Critical:\s+(\d+)", block)
-    warning = re.search(r"Warning:\s+(\d+)", block)
-    info = re.search(r"Info:\s+(\d+)", block)
-    if not (files and critical and warning and info):
+    match = SUMMARY_RE.search(stdout, start + len(TEXT_SUMMARY_MARKER))
+    if not match:
         return None
+    files, critical, warning, info = map(int, match.groups())
     return {
         "project": project_label,
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "totals": {
-            "files": int(files.group(1)),
-            "critical": int(critical.group(1)),
-            "warning": int(warning.group(1)),
-            "info": int(info.group(1)),
+            "files": files,
+            "critical": critical,
+            "warning": warning,
+            "info": info,
         },
     }
 
 
 def parse_module_text_summary(stdout: str, project_label: str) -> Optional[Dict[str, Any]]:
-    marker = "Summary Statistics:"
-    if marker not in stdout:
+    start = stdout.find(MODULE_SUMMARY_MARKER)
+    if start < 0:
         return None
-    block = stdout.split(marker, 1)[-1]
-    files = re.search(r"Files scanned:\s+(\d+)", block)
-    critical = re.search(r"Critical issues:\s+(\d+)", block)
-    warning = re.search(r"Warning issues:\s+(\d+)", block)
-    info = re.search(r"Info items:\s+(\d+)", block)
-    if not (files and critical and warning and info):
+    match = MODULE_SUMMARY_RE.search(stdout, start + len(MODULE_SUMMARY_MARKER))
+    if not match:
         return None
+    files, critical, warning, info = map(int, match.groups())
     return {
         "project": project_label,
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "totals": {
-            "files": int(files.group(1)),
-            "critical": int(critical.group(1)),
-            "warning": int(warning.group(1)),
-            "info": int(info.group(1)),
+            "files": files,
+            "critical": critical,
+            "warning": warning,
+            "info": info,
         },
     }
 
@@ -372,12 +375,20 @@ def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-def timeout_output(value: Any) -> str:
-    if value is None:
-        return ""
-    if isinstance(value, bytes):
-        return value.decode("utf-8", errors="replace")
-    return str(value)
+def append_log_line(path: Path, line: str) -> None:
+    with path.open("ab+") as handle:
+        size = handle.tell()
+        if size:
+            handle.seek(size - 1)
+            if handle.read(1) != b"\n":
+                handle.write(b"\n")
+        handle.write(f"{line}\n".encode("utf-8"))
+
+
+def string_env(values: Dict[str, Any]) -> Dict[str, str]:
+    if all(isinstance(v, str) for v in values.values()):
+        return values
+    return {k: str(v) for k, v in values.items()}
 
 
 def check_expectations(
@@ -389,6 +400,7 @@ def check_expectations(
     fail_on_warning: bool,
 ) -> List[str]:
     errors: List[str] = []
+    expect = expect or {}
     derived_exit = exit_code
     totals: Dict[str, Any] = {}
     if summary and isinstance(summary, dict):
@@ -408,9 +420,7 @@ def check_expectations(
             derived_exit = 0
         if fail_on_warning and (critical + warning) > 0:
             derived_exit = 1
-        if int(totals.get("files", 0) or 0) <= 0 and not bool(
-            (expect or {}).get("allow_zero_files", False)
-        ):
+        if int(totals.get("files", 0) or 0) <= 0 and not bool(expect.get("allow_zero_files", False)):
             errors.append("summary reported zero scanned files")
     if expect:
         need = expect.get("exit_code")
@@ -425,7 +435,7 @@ def check_expectations(
             errors.append(f"expected exit 0 but derived {derived_exit}")
         elif need == "nonzero" and derived_exit == 0:
             errors.append("expected non-zero exit but derived 0")
-    totals_expect = (expect or {}).get("totals", {})
+    totals_expect = expect.get("totals", {})
     for severity, limits in totals_expect.items():
         observed = int(totals.get(severity, 0) or 0)
         lower = limits.get("min")
@@ -434,18 +444,15 @@ def check_expectations(
             errors.append(f"{severity} count {observed} < min {lower}")
         if upper is not None and observed > upper:
             errors.append(f"{severity} count {observed} > max {upper}")
-    for substring in (expect or {}).get("require_substrings", []) or []:
-        if substring not in stdout:
-            errors.append(f"missing substring '{substring}' in stdout")
-    for substring in (expect or {}).get("forbid_substrings", []) or []:
-        if substring in stdout:
-            errors.append(f"forbidden substring '{substring}' present in stdout")
-    for substring in (expect or {}).get("require_substrings_stderr", []) or []:
-        if substring not in stderr:
-            errors.append(f"missing substring '{substring}' in stderr")
-    for substring in (expect or {}).get("forbid_substrings_stderr", []) or []:
-        if substring in stderr:
-            errors.append(f"forbidden substring '{substring}' present in stderr")
+    streams = {"stdout": stdout, "stderr": stderr}
+    for key, stream, required in SUBSTRING_EXPECTATIONS:
+        text = streams[stream]
+        for substring in expect.get(key, []) or []:
+            if (substring in text) != required:
+                if required:
+                    errors.append(f"missing substring '{substring}' in {stream}")
+                else:
+                    errors.append(f"forbidden substring '{substring}' present in {stream}")
     return errors
 
 
@@ -522,9 +529,12 @@ def main() -> None:
     ensure_dir(artifacts_root)
 
     ubs_bin = defaults.get("ubs_bin", "../ubs")
-    ubs_path = resolve_path(manifest_dir, ubs_bin)
+    # Most cases share the default binary; resolve each distinct ubs_bin once.
+    ubs_cmds: Dict[str, str] = {ubs_bin: str(resolve_path(manifest_dir, ubs_bin))}
     default_args = defaults.get("args", [])
-    default_env = {k: str(v) for k, v in (defaults.get("env", {}) or {}).items()}
+    default_env = string_env(defaults.get("env", {}) or {})
+    # Cases share this mapping unless they override something; overrides copy it first.
+    base_env = {**os.environ, **default_env}
 
     failures = 0
     skipped = 0
@@ -546,14 +556,15 @@ def main() -> None:
         case_path_abs = resolve_path(REPO_ROOT, case["path"])
         case_path_arg = os.path.relpath(case_path_abs, REPO_ROOT)
         case_args = case.get("args", [])
-        case_ubs_bin = case.get("ubs_bin")
-        case_ubs_path = resolve_path(manifest_dir, case_ubs_bin) if case_ubs_bin else ubs_path
-        cmd = [str(case_ubs_path), *default_args, *case_args, case_path_arg]
-        env = os.environ.copy()
-        env.update(default_env)
-        env.update({k: str(v) for k, v in (case.get("env", {}) or {}).items()})
-        if (case.get("language") or "").lower() == "python":
-            env.setdefault("ENABLE_UV_TOOLS", "0")
+        case_ubs_bin = case.get("ubs_bin") or ubs_bin
+        case_ubs_cmd = ubs_cmds.get(case_ubs_bin)
+        if case_ubs_cmd is None:
+            case_ubs_cmd = ubs_cmds[case_ubs_bin] = str(resolve_path(manifest_dir, case_ubs_bin))
+        cmd = [case_ubs_cmd, *default_args, *case_args, case_path_arg]
+        case_env = case.get("env", {}) or {}
+        env = {**base_env, **string_env(case_env)} if case_env else base_env
+        if (case.get("language") or "").lower() == "python" and "ENABLE_UV_TOOLS" not in env:
+            env = {**env, "ENABLE_UV_TOOLS": "0"}
 
         artifacts_dir = artifacts_root / case_id
         ensure_dir(artifacts_dir)
@@ -574,24 +585,21 @@ def main() -> None:
                     shim_path.chmod(0o755)
                 except OSError:
                     pass
-            env["PATH"] = f"{shim_dir}{os.pathsep}{env.get('PATH', '')}"
+            env = {**env, "PATH": f"{shim_dir}{os.pathsep}{env.get('PATH', '')}"}
         try:
-            proc = subprocess.run(
-                cmd,
-                cwd=REPO_ROOT,
-                text=True,
-                capture_output=True,
-                env=env,
-                timeout=args.case_timeout if args.case_timeout > 0 else None,
-            )
-        except subprocess.TimeoutExpired as exc:
+            # Stream straight to the artifact logs instead of buffering both pipes in memory.
+            with stdout_path.open("wb") as stdout_file, stderr_path.open("wb") as stderr_file:
+                proc = subprocess.run(
+                    cmd,
+                    cwd=REPO_ROOT,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    env=env,
+                    timeout=args.case_timeout if args.case_timeout > 0 else None,
+                )
+        except subprocess.TimeoutExpired:
             duration = time.time() - start
-            stdout_path.write_text(timeout_output(exc.stdout))
-            stderr_text = timeout_output(exc.stderr)
-            if stderr_text and not stderr_text.endswith("\n"):
-                stderr_text += "\n"
-            stderr_text += f"Timed out after {args.case_timeout}s\n"
-            stderr_path.write_text(stderr_text)
+            append_log_line(stderr_path, f"Timed out after {args.case_timeout}s")
             summary_path.write_text(
                 json.dumps(
                     {
@@ -611,18 +619,22 @@ def main() -> None:
                 break
             continue
         duration = time.time() - start
-        stdout_path.write_text(proc.stdout)
-        stderr_path.write_text(proc.stderr)
-        summary = extract_json_from_stdout(proc.stdout)
+        stdout = stdout_path.read_text(encoding="utf-8", errors="replace")
+        # stderr is only inspected by the *_stderr substring expectations; leave it on disk otherwise.
+        stderr = ""
+        case_expect = case.get("expect") or {}
+        if any(case_expect.get(key) for key in STDERR_EXPECT_KEYS):
+            stderr = stderr_path.read_text(encoding="utf-8", errors="replace")
+        summary = extract_json_from_stdout(stdout)
         summary_error = None
         if summary is None:
-            summary = parse_text_summary(proc.stdout, case_path_arg)
+            summary = parse_text_summary(stdout, case_path_arg)
             if summary is None:
-                summary = parse_module_text_summary(proc.stdout, case_path_arg)
+                summary = parse_module_text_summary(stdout, case_path_arg)
             if summary is None:
-                summary = parse_toon_summary(proc.stdout, case_path_arg)
+                summary = parse_toon_summary(stdout, case_path_arg)
             if summary is None:
-                allow_unparseable = bool((case.get("expect") or {}).get("allow_unparseable_output", False))
+                allow_unparseable = bool(case_expect.get("allow_unparseable_output", False))
                 if not allow_unparseable:
                     summary_error = "Unable to parse UBS output"
         summary_blob = {
@@ -636,11 +648,11 @@ def main() -> None:
 
         fail_on_warning = any(arg == "--fail-on-warning" for arg in cmd)
         errors = check_expectations(
-            case.get("expect", {}),
+            case_expect,
             proc.returncode,
             summary if isinstance(summary, dict) else None,
-            proc.stdout,
-            proc.stderr,
+            stdout,
+            stderr,
             fail_on_warning,
         )
         status = "pass"
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Regression tests for the Rust type narrowing helper."""
+from __future__ import annotations
+
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+HELPER = REPO_ROOT / "modules" / "helpers" / "type_narrowing_rust.py"
+
+
+class RustTypeNarrowingHelperTests(unittest.TestCase):
+    def test_ast_json_byte_offsets_after_non_ascii_text(self) -> None:
+        temp_dir = Path(tempfile.mkdtemp(prefix="ubs-rust-helper-"))
+        try:
+            source = (
+                "// " + "é" * 30 + "\n"
+                "fn f(opt: Option<u8>) {\n"
+                "    while let Some(v) = opt { break; }\n"
+                "    opt.unwrap();\n"
+                "}\n"
+            ).encode("utf-8")
+            (temp_dir / "lib.rs").write_bytes(source)
+            # ast-grep reports byte offsets; a `while let` guard is invisible to the regex fallback.
+            guard = b"while let Some(v) = opt { break; }"
+            start = source.index(guard)
+            match = {
+                "file": "lib.rs",
+                "range": {"byteOffset": {"start": start, "end": start + len(guard)}},
+                "metaVariables": {"single": {"SOURCE": {"text": "opt"}}},
+            }
+            json_path = temp_dir / "matches.jsonl"
+            json_path.write_text(json.dumps(match) + "\n", encoding="utf-8")
+            result = subprocess.run(
+                [sys.executable, str(HELPER), str(temp_dir), "--ast-json", str(json_path)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            prefix = f"{temp_dir.resolve()}/"
+            lines = [line.replace(prefix, "") for line in result.stdout.splitlines() if line.strip()]
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self.assertEqual(lines, ["lib.rs:4:5\topt unwrap/expect after partial guard"])
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()